@@ -0,0 +1,158 @@
+import numpy as np
+
+# Light state codes, matching trajectory_recorder.STATE_NAMES
+GREEN, YELLOW, RED = 0, 1, 2
+STATE_NAMES = ("GREEN", "YELLOW", "RED")
+
+# Each intersection has an NS lane (2 * i) and an EW lane (2 * i + 1)
+NS, EW = 0, 1
+
+
+class CarEngine:
+    def __init__(self, num_intersections: int, max_cars_per_lane: int = 5, speed: float = 4.0,
+                 car_size: float = 15.0, min_spacing: float = 30.0, approach_length: float = 120.0,
+                 exit_distance: float = 80.0, stuck_limit: int = 200):
+        # Car-following model from the GUI, headless and stored as lane x slot arrays.
+        # Positions are distances from the lane's spawn point; slot 0 is the lead car
+        # and active cars are kept packed at the front of each row.
+        self.num_intersections = num_intersections
+        self.num_lanes = num_intersections * 2
+        self.max_cars = max_cars_per_lane
+        self.default_speed = speed
+        self.car_size = car_size
+        self.follow_distance = min_spacing * 1.2
+        self.spawn_clearance = min_spacing * 1.5
+        self.stop_line = approach_length
+        self.exit_line = approach_length + exit_distance
+        self.stuck_limit = stuck_limit
+
+        shape = (self.num_lanes, self.max_cars)
+        self.position = np.zeros(shape)
+        self.speed = np.zeros(shape)
+        self.active = np.zeros(shape, dtype=bool)
+        self.passed = np.zeros(shape, dtype=bool)
+        self.waiting = np.zeros(shape, dtype=bool)
+        self.stuck_time = np.zeros(shape, dtype=np.int64)
+        self.car_id = np.full(shape, -1, dtype=np.int64)
+        self.next_car_id = 0
+
+        self.pending = np.zeros(self.num_lanes, dtype=np.int64)  # Arrivals not yet on the lane
+        self.arrivals = np.zeros(self.num_lanes, dtype=np.int64)  # Arrivals added by the last step
+        self.timings = np.tile(np.array([30, 3, 30, 30, 3, 30], dtype=np.int64), (num_intersections, 1))
+        self.phase_time = 0
+        self.exited = 0
+        self.removed_stuck = 0
+
+    def set_timings(self, timing):
+        # Flat timing genome, six values per intersection
+        self.timings = np.asarray(timing, dtype=np.int64).reshape(self.num_intersections, 6)
+
+    def set_intersection_timing(self, intersection: int, timing):
+        self.timings[intersection] = timing[:6]
+
+    def light_states(self) -> np.ndarray:
+        # (intersection, direction) state codes, same cycle logic as TrafficLight.update
+        t = self.timings
+        ns_cycle = t[:, 0] + t[:, 1] + t[:, 2]
+        ew_cycle = t[:, 3] + t[:, 4] + t[:, 5]
+        ns_pos = self.phase_time % ns_cycle
+        ew_pos = (self.phase_time + ns_cycle // 2) % ew_cycle
+        ns_state = np.where(ns_pos < t[:, 0], GREEN, np.where(ns_pos < t[:, 0] + t[:, 1], YELLOW, RED))
+        ew_state = np.where(ew_pos < t[:, 3], GREEN, np.where(ew_pos < t[:, 3] + t[:, 4], YELLOW, RED))
+        return np.stack([ns_state, ew_state], axis=1)
+
+    def step(self, arrivals=None):
+        # Advance one tick for every car in every lane at once
+        self.phase_time += 1
+        green = (self.light_states() == GREEN).reshape(self.num_lanes, 1)
+        if arrivals is None:
+            arrivals = np.zeros(self.num_lanes, dtype=np.int64)
+        self.arrivals = np.asarray(arrivals, dtype=np.int64)
+        self.pending += self.arrivals
+
+        # Gap to the car ahead in the same lane; the lead car has a free road
+        leader_position = np.roll(self.position, 1, axis=1)
+        leader_active = np.roll(self.active, 1, axis=1)
+        leader_active[:, 0] = False
+        gap = np.where(leader_active, leader_position - self.position, np.inf)
+        too_close = gap < self.follow_distance
+
+        should_stop = ~green & ~self.passed & (self.position + self.speed >= self.stop_line)
+        stopped = self.active & (should_stop | too_close)
+        moving = self.active & ~stopped
+
+        self.position += np.where(moving, self.speed, 0.0)
+        self.stuck_time = np.where(stopped, self.stuck_time + 1, 0)
+        self.waiting = stopped
+        self.passed |= self.active & (self.position > self.stop_line)
+
+        # Remove cars that left the intersection or have been stuck too long
+        exited = self.active & (self.position > self.exit_line)
+        stuck = self.active & ~exited & (self.stuck_time >= self.stuck_limit)
+        if exited.any() or stuck.any():
+            self.exited += int(exited.sum())
+            self.removed_stuck += int(stuck.sum())
+            self.active &= ~(exited | stuck)
+            self._compact()
+
+        self._spawn()
+
+    def _compact(self):
+        # Keep active cars packed at the front of each lane, preserving their order
+        order = np.argsort(~self.active, axis=1, kind='stable')
+        for name in ('position', 'speed', 'active', 'passed', 'waiting', 'stuck_time', 'car_id'):
+            setattr(self, name, np.take_along_axis(getattr(self, name), order, axis=1))
+        self.car_id[~self.active] = -1
+
+    def _spawn(self):
+        # At most one new car per lane per tick, once the entry is clear
+        count = self.active.sum(axis=1)
+        tail = self.position[np.arange(self.num_lanes), np.maximum(count - 1, 0)]
+        lanes = np.nonzero((self.pending > 0) & (count < self.max_cars) &
+                           ((count == 0) | (tail >= self.spawn_clearance)))[0]
+        if not len(lanes):
+            return
+
+        slots = count[lanes]
+        self.position[lanes, slots] = 0.0
+        self.speed[lanes, slots] = self.default_speed
+        self.active[lanes, slots] = True
+        self.passed[lanes, slots] = False
+        self.waiting[lanes, slots] = False
+        self.stuck_time[lanes, slots] = 0
+        self.car_id[lanes, slots] = np.arange(self.next_car_id, self.next_car_id + len(lanes))
+        self.next_car_id += len(lanes)
+        self.pending[lanes] -= 1
+
+    def queue_lengths(self) -> np.ndarray:
+        # (intersection, direction) count of cars stopped on the lane
+        return self.waiting.sum(axis=1).reshape(self.num_intersections, 2)
+
+    def lane_cost(self) -> np.ndarray:
+        # Cars delayed this tick per lane, including arrivals that could not enter yet
+        return self.waiting.sum(axis=1) + self.pending
+
+    def lane_cars(self, lane: int) -> tuple:
+        # Ids and positions of the cars currently on a lane
+        active = self.active[lane]
+        return self.car_id[lane, active], self.position[lane, active]
+
+
+def simulate_batch(timings, num_intersections: int, num_ticks: int, spawn_rate: float,
+                   seed: int = None, callback=None, **engine_options) -> list:
+    # Score many plans in one engine: each plan gets its own copy of the network
+    # and every copy sees the same spawn stream. callback(tick, engine, total) is
+    # called after every tick and stops the run by returning False.
+    num_plans = len(timings)
+    engine = CarEngine(num_plans * num_intersections, **engine_options)
+    engine.set_timings(np.asarray(timings, dtype=np.int64).reshape(-1))
+    rng = np.random.default_rng(seed)
+
+    total = np.zeros(num_plans, dtype=np.int64)
+    for t in range(num_ticks):
+        spawns = (rng.random(num_intersections * 2) < spawn_rate).astype(np.int64)
+        engine.step(np.tile(spawns, num_plans))
+        total += engine.lane_cost().reshape(num_plans, -1).sum(axis=1)
+        if callback is not None and not callback(t, engine, total):
+            return [float('-inf')] * num_plans
+    return [-int(cost) for cost in total]
@@ -0,0 +1,517 @@
+import argparse
+import json
+import math
+import multiprocessing
+import queue
+import random
+import socket
+import struct
+import threading
+import time
+from array import array
+from collections import deque
+from typing import List, Dict, Optional, Tuple
+
+import sim_kernel
+from simple_traffic_optimizer import SimpleTrafficOptimizer
+
+# Every message is a 5-byte header (type, payload length) followed by the payload.
+# Genomes travel as uint16 arrays and fitness values as int64 arrays.
+HEADER = struct.Struct('<BI')
+BATCH_HEADER = struct.Struct('<IIHH')  # batch id, demand stream id, genome count, genome length
+RESULT_HEADER = struct.Struct('<II')   # batch id, result count
+COUNT = struct.Struct('<I')
+
+HELLO = 1       # worker -> coordinator: worker name
+HEARTBEAT = 2   # worker -> coordinator: empty
+SETUP = 3       # coordinator -> worker: JSON optimizer settings and demand rates
+BATCH = 4       # coordinator -> worker: genomes to score
+RESULT = 5      # worker -> coordinator: fitness for one batch
+STEAL = 6       # coordinator -> worker: release up to N batches not yet started
+RELEASED = 7    # worker -> coordinator: ids of the released batches
+SHUTDOWN = 8    # coordinator -> worker: exit
+
+
+def send_message(sock: socket.socket, lock: threading.Lock, kind: int, payload: bytes = b''):
+    with lock:
+        sock.sendall(HEADER.pack(kind, len(payload)) + payload)
+
+
+def _recv_exact(sock: socket.socket, size: int) -> Optional[bytes]:
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            return None
+        data.extend(chunk)
+    return bytes(data)
+
+
+def recv_message(sock: socket.socket) -> Tuple[Optional[int], bytes]:
+    header = _recv_exact(sock, HEADER.size)
+    if header is None:
+        return None, b''
+    kind, length = HEADER.unpack(header)
+    payload = _recv_exact(sock, length) if length else b''
+    if payload is None:
+        return None, b''
+    return kind, payload
+
+
+def encode_batch(batch_id: int, stream_id: int, genomes: List[List[int]]) -> bytes:
+    genome_len = len(genomes[0]) if genomes else 0
+    genes = array('H', [gene for genome in genomes for gene in genome])
+    return BATCH_HEADER.pack(batch_id, stream_id, len(genomes), genome_len) + genes.tobytes()
+
+
+def decode_batch(payload: bytes) -> Tuple[int, int, List[List[int]]]:
+    batch_id, stream_id, count, genome_len = BATCH_HEADER.unpack_from(payload)
+    genes = array('H')
+    genes.frombytes(payload[BATCH_HEADER.size:])
+    genomes = [genes[i * genome_len:(i + 1) * genome_len].tolist() for i in range(count)]
+    return batch_id, stream_id, genomes
+
+
+def encode_result(batch_id: int, scores: List[float]) -> bytes:
+    return RESULT_HEADER.pack(batch_id, len(scores)) + array('q', scores).tobytes()
+
+
+def decode_result(payload: bytes) -> Tuple[int, List[float]]:
+    batch_id, _ = RESULT_HEADER.unpack_from(payload)
+    scores = array('q')
+    scores.frombytes(payload[RESULT_HEADER.size:])
+    return batch_id, scores.tolist()
+
+
+def encode_ids(ids: List[int]) -> bytes:
+    return COUNT.pack(len(ids)) + array('I', ids).tobytes()
+
+
+def decode_ids(payload: bytes) -> List[int]:
+    ids = array('I')
+    ids.frombytes(payload[COUNT.size:])
+    return ids.tolist()
+
+
+class Worker:
+    def __init__(self, host: str = "127.0.0.1", port: int = 9760, heartbeat_interval: float = 1.0,
+                 name: str = None):
+        self.host = host
+        self.port = port
+        self.heartbeat_interval = heartbeat_interval
+        self.name = name or f"{socket.gethostname()}:{multiprocessing.current_process().pid}"
+        self.optimizer = SimpleTrafficOptimizer()
+        self.optimizer.verbose = False
+        self.rates = None
+        self.streams = {}  # Demand stream id -> arrivals, rebuilt from the id alone
+
+        self.queue = deque()  # Batches received but not started
+        self.condition = threading.Condition()
+        self.send_lock = threading.Lock()
+        self.running = True
+
+    def run(self):
+        self.sock = socket.create_connection((self.host, self.port))
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        send_message(self.sock, self.send_lock, HELLO, self.name.encode())
+        threading.Thread(target=self._receive, daemon=True).start()
+        threading.Thread(target=self._heartbeat, daemon=True).start()
+
+        try:
+            while True:
+                with self.condition:
+                    while self.running and not self.queue:
+                        self.condition.wait()
+                    if not self.running:
+                        break
+                    batch_id, stream_id, genomes = self.queue.popleft()
+
+                scores = self.optimizer.evaluate_population(genomes, self.arrivals(stream_id))
+                send_message(self.sock, self.send_lock, RESULT, encode_result(batch_id, scores))
+        except OSError:
+            pass
+        finally:
+            self.running = False
+            self.sock.close()
+
+    def arrivals(self, stream_id: int) -> list:
+        if stream_id not in self.streams:
+            if len(self.streams) >= 8:
+                self.streams.clear()
+            self.streams[stream_id] = self.optimizer.generate_arrivals(self.rates, random.Random(stream_id))
+        return self.streams[stream_id]
+
+    def _receive(self):
+        try:
+            while True:
+                kind, payload = recv_message(self.sock)
+                if kind is None or kind == SHUTDOWN:
+                    break
+                if kind == SETUP:
+                    setup = json.loads(payload)
+                    self.optimizer.apply_settings(setup['settings'])
+                    self.optimizer.verbose = False
+                    self.rates = setup.get('rates')
+                    self.streams.clear()
+                elif kind == BATCH:
+                    with self.condition:
+                        self.queue.append(decode_batch(payload))
+                        self.condition.notify()
+                elif kind == STEAL:
+                    (limit,) = COUNT.unpack(payload)
+                    released = []
+                    with self.condition:
+                        while self.queue and len(released) < limit:
+                            released.append(self.queue.pop()[0])
+                    send_message(self.sock, self.send_lock, RELEASED, encode_ids(released))
+        except OSError:
+            pass
+        finally:
+            with self.condition:
+                self.running = False
+                self.condition.notify()
+
+    def _heartbeat(self):
+        while self.running:
+            try:
+                send_message(self.sock, self.send_lock, HEARTBEAT)
+            except OSError:
+                break
+            time.sleep(self.heartbeat_interval)
+
+
+class WorkerConnection:
+    def __init__(self, worker_id: int, sock: socket.socket):
+        self.worker_id = worker_id
+        self.sock = sock
+        self.send_lock = threading.Lock()
+        self.name = None
+        self.alive = True
+        self.last_seen = time.time()
+        self.assigned = []  # Batch ids sent but not yet answered, oldest first
+        self.steal_pending = False
+        self.completed = 0
+
+
+class Coordinator:
+    def __init__(self, optimizer: SimpleTrafficOptimizer, host: str = "127.0.0.1", port: int = 9760,
+                 batch_size: int = None, prefetch: int = 2, heartbeat_timeout: float = 5.0,
+                 rates: List[Tuple[float, float]] = None, worker_wait: float = 30.0):
+        self.optimizer = optimizer
+        self.batch_size = batch_size  # None sizes batches from the population and live workers
+        self.prefetch = prefetch  # Batches in flight per worker
+        self.heartbeat_timeout = heartbeat_timeout
+        self.rates = rates
+        self.worker_wait = worker_wait
+
+        self.workers: Dict[int, WorkerConnection] = {}
+        self.events = queue.Queue()
+        self.next_worker_id = 0
+        self.next_batch_id = 0
+        self.pending = deque()
+        self.batches = {}
+        self.redispatched = 0
+        self.stolen = 0
+        self.setup = None
+
+        self.server = socket.create_server((host, port))
+        self.address = self.server.getsockname()
+        self.closed = threading.Event()
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        self.server.settimeout(0.5)
+        while not self.closed.is_set():
+            try:
+                sock, _ = self.server.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            worker = WorkerConnection(self.next_worker_id, sock)
+            self.next_worker_id += 1
+            threading.Thread(target=self._receive, args=(worker,), daemon=True).start()
+
+    def _receive(self, worker: WorkerConnection):
+        # Reader threads only parse; all scheduling happens in evaluate()
+        try:
+            while True:
+                kind, payload = recv_message(worker.sock)
+                if kind is None:
+                    break
+                # Stamped on arrival so a backlog of queued events never looks stale
+                worker.last_seen = time.time()
+                self.events.put((worker, kind, payload))
+        except OSError:
+            pass
+        self.events.put((worker, None, b''))
+
+    def _send(self, worker: WorkerConnection, kind: int, payload: bytes = b'') -> bool:
+        try:
+            send_message(worker.sock, worker.send_lock, kind, payload)
+            return True
+        except OSError:
+            self._lose(worker)
+            return False
+
+    def _lose(self, worker: WorkerConnection):
+        # Put everything the worker still owed back at the front of the queue
+        if not worker.alive:
+            return
+        worker.alive = False
+        for batch_id in reversed(worker.assigned):
+            if batch_id in self.batches:
+                self.pending.appendleft(batch_id)
+                self.redispatched += 1
+        worker.assigned = []
+        try:
+            worker.sock.close()
+        except OSError:
+            pass
+        print(f"Lost worker {worker.name or worker.worker_id}")
+
+    def _handle(self, event: tuple, results: List[float]):
+        worker, kind, payload = event
+        if kind is None:
+            self._lose(worker)
+            return
+        if not worker.alive:
+            return
+
+        if kind == HELLO:
+            worker.name = payload.decode()
+            self.workers[worker.worker_id] = worker
+            self._send(worker, SETUP, self._setup_payload())
+        elif kind == RESULT:
+            batch_id, scores = decode_result(payload)
+            if batch_id in worker.assigned:
+                worker.assigned.remove(batch_id)
+            batch = self.batches.pop(batch_id, None)
+            if batch is not None:
+                start = batch[1]
+                results[start:start + len(scores)] = scores
+                worker.completed += 1
+        elif kind == RELEASED:
+            worker.steal_pending = False
+            for batch_id in decode_ids(payload):
+                if batch_id in worker.assigned:
+                    worker.assigned.remove(batch_id)
+                    if batch_id in self.batches:
+                        self.pending.appendleft(batch_id)
+                        self.stolen += 1
+
+    def _setup_payload(self) -> bytes:
+        return json.dumps({'settings': self.optimizer.settings(), 'rates': self.rates}).encode()
+
+    def _dispatch(self):
+        live = [worker for worker in self.workers.values() if worker.alive]
+        for worker in sorted(live, key=lambda w: len(w.assigned)):
+            while self.pending and len(worker.assigned) < self.prefetch:
+                batch_id = self.pending.popleft()
+                stream_id, start, genomes = self.batches[batch_id]
+                worker.assigned.append(batch_id)
+                if not self._send(worker, BATCH, encode_batch(batch_id, stream_id, genomes)):
+                    break
+
+        # Work stealing: idle workers take queued batches from the busiest one
+        if not self.pending:
+            idle = [worker for worker in live if worker.alive and not worker.assigned]
+            victims = [worker for worker in live
+                       if worker.alive and len(worker.assigned) > 1 and not worker.steal_pending]
+            if idle and victims:
+                victim = max(victims, key=lambda w: len(w.assigned))
+                victim.steal_pending = True
+                self._send(victim, STEAL, COUNT.pack(len(victim.assigned) // 2))
+
+    def _check_heartbeats(self):
+        # Only workers holding batches can stall a generation; idle ones are left alone
+        now = time.time()
+        for worker in list(self.workers.values()):
+            if worker.alive and worker.assigned and now - worker.last_seen > self.heartbeat_timeout:
+                self._lose(worker)
+
+    def evaluate(self, population: List[List[int]], stream_id: int = None) -> List[float]:
+        # Score the population on the workers; the demand stream is identified, not sent
+        if stream_id is None:
+            stream_id = random.getrandbits(32)
+
+        # Resend the settings if the optimizer changed since workers last saw them
+        setup = self._setup_payload()
+        if setup != self.setup:
+            self.setup = setup
+            for worker in list(self.workers.values()):
+                if worker.alive:
+                    self._send(worker, SETUP, setup)
+
+        # A batch is a full round trip, so by default each live worker gets about
+        # prefetch batches per generation; smaller ones only help work stealing
+        batch_size = self.batch_size
+        if batch_size is None:
+            live = max(1, sum(worker.alive for worker in self.workers.values()))
+            batch_size = max(1, math.ceil(len(population) / (live * self.prefetch)))
+
+        results = [None] * len(population)
+        for start in range(0, len(population), batch_size):
+            batch_id = self.next_batch_id
+            self.next_batch_id = (self.next_batch_id + 1) % 2 ** 32
+            self.batches[batch_id] = (stream_id, start, population[start:start + batch_size])
+            self.pending.append(batch_id)
+
+        no_workers_since = None
+        while self.batches:
+            self._dispatch()
+            try:
+                self._handle(self.events.get(timeout=0.1), results)
+                # Drain everything already received before judging heartbeats
+                while True:
+                    self._handle(self.events.get_nowait(), results)
+            except queue.Empty:
+                pass
+            self._check_heartbeats()
+
+            if any(worker.alive for worker in self.workers.values()):
+                no_workers_since = None
+            elif no_workers_since is None:
+                no_workers_since = time.time()
+            elif time.time() - no_workers_since > self.worker_wait:
+                self.batches.clear()
+                self.pending.clear()
+                raise RuntimeError("No workers available")
+        return results
+
+    def wait_for_workers(self, count: int, timeout: float = 30.0):
+        deadline = time.time() + timeout
+        while sum(worker.alive for worker in self.workers.values()) < count:
+            if time.time() > deadline:
+                raise RuntimeError(f"Only {len(self.workers)} of {count} workers connected")
+            try:
+                self._handle(self.events.get(timeout=0.1), [])
+            except queue.Empty:
+                pass
+
+    def close(self):
+        self.closed.set()
+        for worker in self.workers.values():
+            if worker.alive:
+                self._send(worker, SHUTDOWN)
+                worker.sock.close()
+        self.server.close()
+
+
+def run_worker(host: str, port: int, heartbeat_interval: float = 1.0):
+    Worker(host, port, heartbeat_interval).run()
+
+
+def run_local_worker(host: str, port: int):
+    # Local workers share this machine's cores, so keep each one's kernels serial
+    sim_kernel.single_threaded()
+    run_worker(host, port)
+
+
+def spawn_local_workers(count: int, host: str, port: int) -> List[multiprocessing.Process]:
+    # Spawned rather than forked: forking after the parallel kernel has started
+    # its thread pool leaves this process hanging at exit
+    context = multiprocessing.get_context("spawn")
+    workers = []
+    for _ in range(count):
+        process = context.Process(target=run_local_worker, args=(host, port), daemon=True)
+        process.start()
+        workers.append(process)
+    return workers
+
+
+def benchmark(worker_counts: List[int] = (1, 2, 4), population_size: int = 400, simulation_time: int = 500,
+              num_intersections: int = 4, generations: int = 5, seed: int = 0) -> List[Dict]:
+    # Seconds per generation on localhost workers against evaluate_population in this
+    # process, for the same seeded population and demand stream ids
+    optimizer = SimpleTrafficOptimizer()
+    optimizer.verbose = False
+    optimizer.simulation_time = simulation_time
+    optimizer.num_intersections = num_intersections
+    rng = random.Random(seed)
+    random.seed(seed)
+    population = [optimizer.create_individual() for _ in range(population_size)]
+    stream_ids = [rng.getrandbits(32) for _ in range(generations)]
+
+    def local(stream_id: int) -> List[float]:
+        return optimizer.evaluate_population(population, optimizer.generate_arrivals(None, random.Random(stream_id)))
+
+    local(stream_ids[0])  # Load the compiled kernel before timing
+    start = time.time()
+    expected = [local(stream_id) for stream_id in stream_ids]
+    local_time = (time.time() - start) / generations
+    rows = [{'workers': 0, 'seconds_per_generation': local_time, 'speedup': 1.0, 'matches_local': True}]
+
+    for count in worker_counts:
+        coordinator = Coordinator(optimizer, port=0)
+        processes = spawn_local_workers(count, *coordinator.address)
+        try:
+            coordinator.wait_for_workers(count)
+            coordinator.evaluate(population, stream_ids[0])  # Warm up every worker
+            start = time.time()
+            scores = [coordinator.evaluate(population, stream_id) for stream_id in stream_ids]
+            elapsed = (time.time() - start) / generations
+        finally:
+            coordinator.close()
+            for process in processes:
+                process.join(timeout=5)
+        rows.append({'workers': count, 'seconds_per_generation': elapsed, 'speedup': local_time / elapsed,
+                     'matches_local': scores == expected})
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Distributed fitness evaluation for SimpleTrafficOptimizer")
+    subparsers = parser.add_subparsers(dest="role", required=True)
+
+    worker_parser = subparsers.add_parser("worker", help="Connect to a coordinator and score batches")
+    worker_parser.add_argument("--host", default="127.0.0.1")
+    worker_parser.add_argument("--port", type=int, default=9760)
+
+    coordinator_parser = subparsers.add_parser("coordinator", help="Run optimize() on connected workers")
+    coordinator_parser.add_argument("--host", default="127.0.0.1")
+    coordinator_parser.add_argument("--port", type=int, default=9760)
+    coordinator_parser.add_argument("--workers", type=int, default=1, help="Workers to wait for")
+    coordinator_parser.add_argument("--local-workers", type=int, default=0, help="Workers to spawn on this machine")
+    coordinator_parser.add_argument("--intersections", type=int, default=4)
+    coordinator_parser.add_argument("--generations", type=int, default=50)
+    coordinator_parser.add_argument("--population", type=int, default=30)
+    coordinator_parser.add_argument("--batch-size", type=int, default=None,
+                                    help="Genomes per batch; by default sized from the population and workers")
+
+    benchmark_parser = subparsers.add_parser("benchmark", help="Time local workers against in-process evaluation")
+    benchmark_parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    benchmark_parser.add_argument("--population", type=int, default=400)
+    benchmark_parser.add_argument("--ticks", type=int, default=500)
+    benchmark_parser.add_argument("--intersections", type=int, default=4)
+    benchmark_parser.add_argument("--generations", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.role == "worker":
+        run_worker(args.host, args.port)
+        return
+    if args.role == "benchmark":
+        for row in benchmark(args.workers, args.population, args.ticks, args.intersections, args.generations):
+            label = f"{row['workers']} workers" if row['workers'] else "local"
+            print(f"{label}: {row['seconds_per_generation'] * 1000:.1f} ms per generation, "
+                  f"speedup {row['speedup']:.2f}, matches local: {row['matches_local']}")
+        return
+
+    optimizer = SimpleTrafficOptimizer()
+    optimizer.num_intersections = args.intersections
+    optimizer.num_generations = args.generations
+    optimizer.population_size = args.population
+    coordinator = Coordinator(optimizer, args.host, args.port, batch_size=args.batch_size)
+    spawn_local_workers(args.local_workers, *coordinator.address)
+    try:
+        coordinator.wait_for_workers(max(args.workers, args.local_workers))
+        optimizer.evaluator = coordinator
+        best_solution, best_fitness = optimizer.optimize()
+        print(f"Best Solution: {best_solution}")
+        print(f"Best Fitness: {best_fitness}")
+    finally:
+        coordinator.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,301 @@
+import argparse
+import hashlib
+import itertools
+import json
+import math
+import random
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import List, Dict, Optional
+
+import sim_kernel
+from simple_traffic_optimizer import SimpleTrafficOptimizer
+
+# A search space maps an optimizer attribute to a list of choices or a (low, high) range
+DEFAULT_SPACE = {
+    'population_size': [20, 30, 50],
+    'mutation_rate': [0.05, 0.1, 0.2],
+    'crossover_rate': [0.6, 0.8, 0.95],
+    'elite_size': [1, 2, 4],
+    'tournament_size': [2, 3, 5],
+}
+
+
+def grid_configs(space: Dict) -> List[Dict]:
+    names = sorted(space)
+    return [dict(zip(names, values)) for values in itertools.product(*(space[name] for name in names))]
+
+
+def _sample_value(spec, rng: random.Random):
+    if isinstance(spec, tuple):
+        low, high = spec
+        if isinstance(low, int) and isinstance(high, int):
+            return rng.randint(low, high)
+        return rng.uniform(low, high)
+    return rng.choice(spec)
+
+
+def random_configs(space: Dict, count: int, seed: int = 0) -> List[Dict]:
+    # Seeded so a resumed sweep regenerates the same configurations
+    rng = random.Random(seed)
+    return [{name: _sample_value(space[name], rng) for name in sorted(space)} for _ in range(count)]
+
+
+def suggest_tpe(space: Dict, scored: List[tuple], count: int, rng: random.Random,
+                gamma: float = 0.25, candidates: int = 32) -> List[Dict]:
+    # Tree-structured Parzen estimator: favour values common among the best
+    # configurations and rare among the rest. scored is [(config, cost)], lower is better.
+    if len(scored) < 4:
+        return [{name: _sample_value(space[name], rng) for name in sorted(space)} for _ in range(count)]
+
+    ranked = sorted(scored, key=lambda item: item[1])
+    split = max(1, int(gamma * len(ranked)))
+    good = [config for config, _ in ranked[:split]]
+    bad = [config for config, _ in ranked[split:]]
+
+    def density(name, value, configs):
+        spec = space[name]
+        if isinstance(spec, tuple):
+            width = (spec[1] - spec[0]) / 5 or 1
+            weight = sum(math.exp(-0.5 * ((config[name] - value) / width) ** 2) for config in configs)
+            return (weight + 0.1) / (len(configs) + 1)
+        return (sum(config[name] == value for config in configs) + 1) / (len(configs) + len(spec))
+
+    def sample_near_good(name):
+        spec = space[name]
+        anchor = rng.choice(good)[name]
+        if isinstance(spec, tuple):
+            low, high = spec
+            value = min(high, max(low, rng.gauss(anchor, (high - low) / 5)))
+            return round(value) if isinstance(low, int) and isinstance(high, int) else value
+        return anchor if rng.random() < 0.7 else rng.choice(spec)
+
+    def score(config):
+        return sum(math.log(density(name, config[name], good) / density(name, config[name], bad))
+                   for name in space)
+
+    pool = [{name: sample_near_good(name) for name in sorted(space)} for _ in range(candidates * count)]
+    return sorted(pool, key=score, reverse=True)[:count]
+
+
+def settings_key(settings: Dict) -> str:
+    return hashlib.sha1(json.dumps(settings, sort_keys=True).encode()).hexdigest()
+
+
+def run_key(config: Dict, seed: int, settings: Dict) -> str:
+    payload = json.dumps({'config': config, 'seed': seed, 'settings': settings}, sort_keys=True)
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+
+def first_hit(history: List[List[float]], target: Optional[float]) -> Optional[tuple]:
+    # (elapsed, evaluations) of the first generation whose best fitness reached the target
+    if target is None:
+        return None
+    return next(((elapsed, evaluations) for best_fitness, elapsed, evaluations in history
+                 if best_fitness >= target), None)
+
+
+class ResultStore:
+    # Completed runs in a local SQLite file, keyed by configuration, seed and base settings.
+    # Runs keep their per-generation progress so any target can be scored when reporting.
+    def __init__(self, path: str):
+        self.db = sqlite3.connect(path)
+        self.db.execute("""CREATE TABLE IF NOT EXISTS results (
+            key TEXT PRIMARY KEY,
+            settings TEXT NOT NULL,
+            config TEXT NOT NULL,
+            seed INTEGER NOT NULL,
+            best_fitness REAL,
+            history TEXT NOT NULL,
+            elapsed REAL,
+            evaluations INTEGER,
+            generations INTEGER,
+            completed_at REAL)""")
+        self.db.execute("CREATE INDEX IF NOT EXISTS results_settings ON results (settings, config)")
+        self.db.commit()
+
+    def has(self, key: str) -> bool:
+        return self.db.execute("SELECT 1 FROM results WHERE key = ?", (key,)).fetchone() is not None
+
+    def add(self, key: str, settings: str, config: Dict, seed: int, result: Dict):
+        self.db.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", (
+            key, settings, json.dumps(config, sort_keys=True), seed, result['best_fitness'],
+            json.dumps(result['history']), result['elapsed'], result['evaluations'],
+            result['generations'], time.time()))
+        self.db.commit()
+
+    def rows(self, settings: str) -> List[Dict]:
+        # Only runs made with the given base settings are comparable
+        cursor = self.db.execute("SELECT config, seed, best_fitness, history, elapsed, evaluations, "
+                                 "generations FROM results WHERE settings = ?", (settings,))
+        names = [column[0] for column in cursor.description]
+        rows = [dict(zip(names, row)) for row in cursor]
+        for row in rows:
+            row['config'] = json.loads(row['config'])
+            row['history'] = json.loads(row['history'])
+        return rows
+
+    def close(self):
+        self.db.close()
+
+
+def run_config(config: Dict, seed: int, settings: Dict) -> Dict:
+    optimizer = SimpleTrafficOptimizer()
+    optimizer.apply_settings(settings)
+    optimizer.apply_settings(config)
+    optimizer.verbose = False
+
+    # Load the compiled kernel before the clock starts so time to target is comparable
+    optimizer.evaluate_population([optimizer.create_individual()])
+    random.seed(seed)
+
+    best_solution, best_fitness = optimizer.optimize()
+    last = optimizer.history[-1]
+    return {
+        'best_fitness': best_fitness,
+        'history': [[entry['best_fitness'], entry['elapsed'], entry['evaluations']]
+                    for entry in optimizer.history],
+        'elapsed': last['elapsed'],
+        'evaluations': last['evaluations'],
+        'generations': len(optimizer.history)
+    }
+
+
+def summarize(rows: List[Dict], target: Optional[float]) -> List[Dict]:
+    # One line per configuration; the cheapest configurations that reliably hit the target first
+    grouped = {}
+    for row in rows:
+        grouped.setdefault(json.dumps(row['config'], sort_keys=True), []).append(row)
+
+    summary = []
+    for runs in grouped.values():
+        hits = [hit for hit in (first_hit(run['history'], target) for run in runs) if hit is not None]
+        summary.append({
+            'config': runs[0]['config'],
+            'seeds': len(runs),
+            'mean_best_fitness': sum(run['best_fitness'] for run in runs) / len(runs),
+            'hit_rate': len(hits) / len(runs),
+            'mean_time_to_target': sum(elapsed for elapsed, _ in hits) / len(hits) if hits else None,
+            'mean_evaluations_to_target': sum(evaluations for _, evaluations in hits) / len(hits) if hits else None
+        })
+
+    if target is None:
+        return sorted(summary, key=lambda item: -item['mean_best_fitness'])
+    return sorted(summary, key=lambda item: (-item['hit_rate'],
+                                             item['mean_evaluations_to_target'] or float('inf')))
+
+
+def config_cost(summary_line: Dict, target: Optional[float], max_evaluations: int) -> float:
+    # Lower is better: evaluations to reach the target, with misses penalised
+    if target is None:
+        return -summary_line['mean_best_fitness']
+    hit_rate = summary_line['hit_rate']
+    if hit_rate == 0:
+        return 2.0 * max_evaluations
+    return summary_line['mean_evaluations_to_target'] / hit_rate
+
+
+class SweepRunner:
+    def __init__(self, store_path: str = "sweep_results.db", optimizer: SimpleTrafficOptimizer = None,
+                 seeds: List[int] = (0, 1, 2), target: Optional[float] = None, workers: int = None):
+        self.store = ResultStore(store_path)
+        self.settings = (optimizer or SimpleTrafficOptimizer()).settings()
+        self.settings['verbose'] = False
+        self.settings_key = settings_key(self.settings)
+        self.seeds = list(seeds)
+        self.target = target
+        self.workers = workers
+
+    def run(self, configs: List[Dict]) -> int:
+        # Run every (config, seed) not already in the store; results are saved as they finish.
+        # The target is not part of the key since hits are worked out from each run's history.
+        jobs = []
+        for config in configs:
+            for seed in self.seeds:
+                key = run_key(config, seed, self.settings)
+                if not self.store.has(key):
+                    jobs.append((key, config, seed))
+        if not jobs:
+            return 0
+
+        with ProcessPoolExecutor(self.workers, initializer=sim_kernel.single_threaded) as pool:
+            futures = {pool.submit(run_config, config, seed, self.settings): (key, config, seed)
+                       for key, config, seed in jobs}
+            for done, future in enumerate(as_completed(futures), 1):
+                key, config, seed = futures[future]
+                result = future.result()
+                self.store.add(key, self.settings_key, config, seed, result)
+                hit = first_hit(result['history'], self.target)
+                print(f"[{done}/{len(jobs)}] {config} seed {seed}: Best Fitness = {result['best_fitness']}, "
+                      f"Time To Target = {hit[0] if hit else None}")
+        return len(jobs)
+
+    def run_tpe(self, space: Dict, trials: int, batch_size: int = 4, seed: int = 0):
+        # Sequential model-based search; resumes from whatever the store already holds
+        rng = random.Random(seed)
+        max_evaluations = self.settings['population_size'] * self.settings['num_generations']
+        repeats = 0
+        while repeats < 5:
+            summary = [line for line in self.summary() if set(line['config']) == set(space)]
+            if len(summary) >= trials:
+                break
+            scored = [(line['config'], config_cost(line, self.target, max_evaluations)) for line in summary]
+            # Stop if a small discrete space keeps suggesting finished configurations
+            if self.run(suggest_tpe(space, scored, min(batch_size, trials - len(summary)), rng)):
+                repeats = 0
+            else:
+                repeats += 1
+
+    def summary(self) -> List[Dict]:
+        return summarize(self.store.rows(self.settings_key), self.target)
+
+    def report(self, limit: int = 10):
+        for line in self.summary()[:limit]:
+            time_to_target = line['mean_time_to_target']
+            print(f"{line['config']}: hit rate {line['hit_rate']:.0%} over {line['seeds']} seeds, "
+                  f"mean best {line['mean_best_fitness']:.1f}, "
+                  f"time to target {'-' if time_to_target is None else f'{time_to_target:.2f}s'}, "
+                  f"evaluations to target {line['mean_evaluations_to_target'] or '-'}")
+
+    def close(self):
+        self.store.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parallel GA hyperparameter sweep with a resumable result store")
+    parser.add_argument("--search", choices=["grid", "random", "tpe"], default="grid")
+    parser.add_argument("--space", help="JSON search space; lists are choices, two-item arrays prefixed "
+                                        "with 'range' are (low, high) ranges")
+    parser.add_argument("--trials", type=int, default=20, help="Configurations for random/tpe search")
+    parser.add_argument("--seeds", type=int, default=3, help="Seeds per configuration")
+    parser.add_argument("--target", type=float, default=None, help="Fitness that counts as good enough")
+    parser.add_argument("--generations", type=int, default=50)
+    parser.add_argument("--intersections", type=int, default=4)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--store", default="sweep_results.db")
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    space = DEFAULT_SPACE
+    if args.space:
+        space = {name: tuple(spec[1:]) if spec and spec[0] == 'range' else spec
+                 for name, spec in json.loads(args.space).items()}
+
+    optimizer = SimpleTrafficOptimizer()
+    optimizer.num_generations = args.generations
+    optimizer.num_intersections = args.intersections
+    runner = SweepRunner(args.store, optimizer, range(args.seeds), args.target, args.workers)
+    try:
+        if args.search == "grid":
+            runner.run(grid_configs(space))
+        elif args.search == "random":
+            runner.run(random_configs(space, args.trials))
+        else:
+            runner.run_tpe(space, args.trials)
+        runner.report(args.top)
+    finally:
+        runner.close()
+
+if __name__ == "__main__":
+    main()
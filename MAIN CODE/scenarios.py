@@ -0,0 +1,98 @@
+import math
+import random
+from typing import List, Tuple, Optional
+
+import sim_kernel
+from simple_traffic_optimizer import SimpleTrafficOptimizer
+
+
+class Scenario:
+    def __init__(self, name: str, ns_rate: Optional[float] = None, ew_rate: Optional[float] = None,
+                 rates: List[Tuple[float, float]] = None, incident: Tuple = None):
+        # Demand for one scenario: uniform NS/EW rates (cars per tick), explicit
+        # per-intersection rates, or neither for the default randint(0, 3) model.
+        # incident is (intersection, direction, start_tick, duration, extra_rate)
+        # and adds a surge of diverted traffic on one approach.
+        self.name = name
+        self.ns_rate = ns_rate
+        self.ew_rate = ew_rate
+        self.rates = rates
+        self.incident = incident
+
+    def intersection_rates(self, num_intersections: int) -> Optional[List[Tuple[float, float]]]:
+        if self.rates is not None:
+            return self.rates
+        if self.ns_rate is None and self.ew_rate is None:
+            return None
+        return [(self.ns_rate, self.ew_rate)] * num_intersections
+
+    def arrivals(self, optimizer: SimpleTrafficOptimizer, rng: random.Random = None) -> List[List[Tuple[int, int]]]:
+        rng = rng or random
+        arrivals = optimizer.generate_arrivals(self.intersection_rates(optimizer.num_intersections), rng)
+        if self.incident:
+            intersection, direction, start, duration, extra_rate = self.incident
+            lane = 0 if direction == 'NS' else 1
+            for t in range(start, min(start + duration, len(arrivals))):
+                counts = list(arrivals[t][intersection])
+                counts[lane] += optimizer._poisson(rng, extra_rate)
+                arrivals[t][intersection] = tuple(counts)
+        return arrivals
+
+
+def default_scenarios(simulation_time: int = 100) -> List[Scenario]:
+    return [
+        Scenario("baseline"),
+        Scenario("peak", 2.2, 2.2),
+        Scenario("off_peak", 0.6, 0.6),
+        Scenario("ns_heavy", 2.0, 0.8),
+        Scenario("ew_heavy", 0.8, 2.0),
+        Scenario("incident", 1.5, 1.5, incident=(0, 'NS', simulation_time // 4, simulation_time // 2, 2.0)),
+    ]
+
+
+def aggregate(scores: List[float], objective: str = "mean", alpha: float = 0.2) -> float:
+    # Collapse per-scenario fitness (higher is better) into one value
+    if objective == "mean":
+        return sum(scores) / len(scores)
+    if objective == "worst":
+        return min(scores)
+    if objective == "cvar":
+        # Mean of the worst alpha share of scenarios
+        tail = max(1, math.ceil(alpha * len(scores)))
+        return sum(sorted(scores)[:tail]) / tail
+    raise ValueError(f"Unknown objective: {objective}")
+
+
+class ScenarioEnsemble:
+    def __init__(self, optimizer: SimpleTrafficOptimizer, scenarios: List[Scenario] = None,
+                 objective: str = "mean", alpha: float = 0.2, resample: bool = True, seed: int = None):
+        self.optimizer = optimizer
+        self.scenarios = scenarios or default_scenarios(optimizer.simulation_time)
+        self.objective = objective
+        self.alpha = alpha
+        self.resample = resample  # Draw fresh demand for every evaluate() call
+        self.rng = random.Random(seed)
+        self.streams = None
+
+    def sample(self):
+        # One arrival stream per scenario, shared by every plan scored against it
+        self.streams = [scenario.arrivals(self.optimizer, self.rng) for scenario in self.scenarios]
+
+    def scores(self, population: List[List[int]]) -> List[List[float]]:
+        # Per-scenario fitness rows, one row per plan
+        if self.streams is None or self.resample:
+            self.sample()
+        return sim_kernel.simulate_ensemble(population, self.streams)
+
+    def aggregate(self, row: List[float]) -> float:
+        return aggregate(row, self.objective, self.alpha)
+
+    def evaluate(self, population: List[List[int]]) -> List[float]:
+        return [self.aggregate(row) for row in self.scores(population)]
+
+    def evaluate_plan(self, timing: List[int]) -> float:
+        return self.evaluate([timing])[0]
+
+    def report(self, timing: List[int]) -> dict:
+        row = self.scores([timing])[0]
+        return {scenario.name: fitness for scenario, fitness in zip(self.scenarios, row)}
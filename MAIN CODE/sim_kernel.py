@@ -0,0 +1,133 @@
+from typing import List, Tuple
+
+# Numba is optional; without it SimpleTrafficOptimizer falls back to simulate_traffic
+# and ensembles use the plain-Python loops below
+try:
+    import numpy as np
+    from numba import njit, prange
+    HAVE_NUMBA = True
+except ImportError:
+    HAVE_NUMBA = False
+
+
+if HAVE_NUMBA:
+    @njit(cache=True)
+    def _simulate_one(timing, arrivals):
+        # Same recurrence as TrafficLight.update for every (intersection, tick)
+        num_ticks = arrivals.shape[0]
+        num_intersections = arrivals.shape[1]
+        total = 0
+        for i in range(num_intersections):
+            base = i * 6
+            ns_green = timing[base]
+            ns_yellow = timing[base + 1]
+            ns_cycle = ns_green + ns_yellow + timing[base + 2]
+            ew_green = timing[base + 3]
+            ew_yellow = timing[base + 4]
+            ew_cycle = ew_green + ew_yellow + timing[base + 5]
+            ew_offset = ns_cycle // 2
+
+            queue_ns = 0
+            queue_ew = 0
+            for t in range(num_ticks):
+                phase_time = t + 1
+                queue_ns += arrivals[t, i, 0]
+                queue_ew += arrivals[t, i, 1]
+                if phase_time % ns_cycle < ns_green:
+                    queue_ns -= min(3, queue_ns)
+                if (phase_time + ew_offset) % ew_cycle < ew_green:
+                    queue_ew -= min(3, queue_ew)
+                total += queue_ns + queue_ew
+        return -total
+
+    @njit(cache=True, parallel=True)
+    def _simulate_batch(timings, arrivals, out):
+        for p in prange(timings.shape[0]):
+            out[p] = _simulate_one(timings[p], arrivals)
+
+    @njit(cache=True, parallel=True)
+    def _simulate_ensemble(timings, streams, out):
+        num_scenarios = streams.shape[0]
+        for job in prange(timings.shape[0] * num_scenarios):
+            p = job // num_scenarios
+            s = job % num_scenarios
+            out[p, s] = _simulate_one(timings[p], streams[s])
+
+
+def single_threaded():
+    # Process-pool initializer: the pool already uses every core, so keep kernels serial
+    if HAVE_NUMBA:
+        import numba
+        numba.set_num_threads(1)
+
+
+def simulate_batch(population: List[List[int]], arrivals: List[List[Tuple[int, int]]]) -> List[float]:
+    # Score a batch of timing plans against one fixed arrival stream
+    timings = np.asarray(population, dtype=np.int64)
+    stream = np.asarray(arrivals, dtype=np.int64)
+    out = np.empty(len(population), dtype=np.int64)
+    _simulate_batch(timings, stream, out)
+    return [int(fitness) for fitness in out]
+
+
+def simulate(timing: List[int], arrivals: List[List[Tuple[int, int]]]) -> float:
+    return simulate_batch([timing], arrivals)[0]
+
+
+def light_schedule(timing: List[int], num_intersections: int, num_ticks: int) -> List[tuple]:
+    # Per-intersection NS/EW green masks; these depend only on the plan, not on demand
+    schedule = []
+    for i in range(num_intersections):
+        ns_green, ns_yellow, ns_red, ew_green, ew_yellow, ew_red = timing[i * 6:i * 6 + 6]
+        ns_cycle = ns_green + ns_yellow + ns_red
+        ew_cycle = ew_green + ew_yellow + ew_red
+        ew_offset = ns_cycle // 2
+        schedule.append((
+            [phase_time % ns_cycle < ns_green for phase_time in range(1, num_ticks + 1)],
+            [(phase_time + ew_offset) % ew_cycle < ew_green for phase_time in range(1, num_ticks + 1)]
+        ))
+    return schedule
+
+
+def split_stream(arrivals: List[List[Tuple[int, int]]]) -> List[tuple]:
+    # Per-intersection NS/EW arrival columns of an arrivals[tick][intersection] stream
+    return [([tick[i][0] for tick in arrivals], [tick[i][1] for tick in arrivals])
+            for i in range(len(arrivals[0]))]
+
+
+def queue_cost(green_ns: List[bool], green_ew: List[bool],
+               arrivals_ns: List[int], arrivals_ew: List[int]) -> int:
+    # Total queued cars over all ticks for one intersection
+    queue_ns = queue_ew = total = 0
+    for is_green_ns, is_green_ew, new_ns, new_ew in zip(green_ns, green_ew, arrivals_ns, arrivals_ew):
+        queue_ns += new_ns
+        queue_ew += new_ew
+        if is_green_ns:
+            queue_ns = queue_ns - 3 if queue_ns > 3 else 0
+        if is_green_ew:
+            queue_ew = queue_ew - 3 if queue_ew > 3 else 0
+        total += queue_ns + queue_ew
+    return total
+
+
+def simulate_ensemble(population: List[List[int]],
+                      streams: List[List[List[Tuple[int, int]]]]) -> List[List[float]]:
+    # Fitness of every plan under every arrival stream, as rows of one score per stream
+    if HAVE_NUMBA:
+        timings = np.asarray(population, dtype=np.int64)
+        stacked = np.asarray(streams, dtype=np.int64)
+        out = np.empty((len(population), len(streams)), dtype=np.int64)
+        _simulate_ensemble(timings, stacked, out)
+        return [[int(fitness) for fitness in row] for row in out]
+
+    # Demand columns are shared by all plans and schedules by all streams
+    num_ticks = len(streams[0])
+    num_intersections = len(streams[0][0])
+    columns = [split_stream(stream) for stream in streams]
+    scores = []
+    for timing in population:
+        schedule = light_schedule(timing, num_intersections, num_ticks)
+        scores.append([-sum(queue_cost(green_ns, green_ew, arrivals_ns, arrivals_ew)
+                            for (green_ns, green_ew), (arrivals_ns, arrivals_ew) in zip(schedule, stream_columns))
+                       for stream_columns in columns])
+    return scores
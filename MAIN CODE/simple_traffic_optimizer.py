@@ -1,6 +1,9 @@
 import random
-from typing import List, Dict, Callable
+import math
+from typing import List, Dict, Callable, Optional, Tuple
 import time
+from trajectory_recorder import TrajectoryRecorder
+import sim_kernel
 
 class SimpleTrafficOptimizer:
     def __init__(self):
@@ -23,6 +26,56 @@ class SimpleTrafficOptimizer:
         self.mutation_rate = 0.1
         self.crossover_rate = 0.8
         self.elite_size = 2
+        self.tournament_size = 3
+
+        # Convergence control; None disables a limit
+        self.patience = None            # Generations without improvement before stopping
+        self.min_improvement = 0.0      # Best-fitness gain that counts as improvement
+        self.max_time = None            # Wall-clock budget in seconds
+        self.max_evaluations = None     # Budget of individual fitness evaluations, memetic trials included
+        self.adaptive_mutation = False  # Adapt mutation_rate to stagnation and diversity
+        self.min_mutation_rate = 0.02
+        self.max_mutation_rate = 0.5
+        self.diversity_threshold = 0.3  # Mean normalized gene entropy considered converged
+
+        # Memetic local search on the elites after each generation; 0 disables it
+        self.memetic_budget = 0         # Trial moves per generation, shared by the elites
+        self.memetic_step = 2           # Largest +/- change tried on a single gene
+
+        # Per-generation statistics and stop reason of the last optimize() run
+        self.history = []
+        self.stop_reason = None
+
+        # Use the Numba kernel for batch fitness evaluation when it is installed
+        self.use_compiled_kernel = True
+
+        # Fitness model: "queue" (TrafficLight queues) or "microsim" (car_engine,
+        # the car-following model the GUI renders; needs NumPy)
+        self.fitness_backend = "queue"
+        self.microsim_spawn_rate = 0.12  # Chance of a new car per approach per tick
+
+        # Optional scenarios.ScenarioEnsemble used as the optimize() fitness
+        self.scenario_ensemble = None
+
+        # Print per-generation progress from optimize()
+        self.verbose = True
+
+        # Final population of the last optimize() run, for warm starts, and the
+        # best elite_size individuals of its last scored generation, best first
+        self.population = None
+        self.elites = []
+
+        # Optional remote evaluator (e.g. distributed.Coordinator) used by optimize()
+        self.evaluator = None
+
+    def settings(self) -> Dict:
+        # Plain parameters, enough to rebuild the optimizer in another process
+        return {name: value for name, value in vars(self).items()
+                if isinstance(value, (bool, int, float, str))}
+
+    def apply_settings(self, settings: Dict):
+        for name, value in settings.items():
+            setattr(self, name, value)
 
     class TrafficLight:
         def __init__(self, id):
@@ -36,8 +89,10 @@ class SimpleTrafficOptimizer:
             self.waiting_time_ns = 0
             self.waiting_time_ew = 0
             self.phase_time = 0
+            self.arrivals_ns = 0
+            self.arrivals_ew = 0
 
-        def update(self) -> float:
+        def update(self, new_cars_ns: int = None, new_cars_ew: int = None) -> float:
             # Update phase time
             self.phase_time += 1
             
@@ -61,11 +116,15 @@ class SimpleTrafficOptimizer:
             else:
                 self.state_ew = "RED"
             
-            # Generate random traffic
-            new_cars_ns = random.randint(0, 3)
-            new_cars_ew = random.randint(0, 3)
+            # Generate random traffic unless arrivals are supplied
+            if new_cars_ns is None:
+                new_cars_ns = random.randint(0, 3)
+            if new_cars_ew is None:
+                new_cars_ew = random.randint(0, 3)
             
             # Add new cars to queues
+            self.arrivals_ns = new_cars_ns
+            self.arrivals_ew = new_cars_ew
             self.queue_ns += new_cars_ns
             self.queue_ew += new_cars_ew
             
@@ -118,7 +177,40 @@ class SimpleTrafficOptimizer:
         else:
             return "RED"
 
-    def simulate_traffic(self, timing: List[int], gui_callback: Callable = None) -> float:
+    def generate_arrivals(self, rates: List[Tuple[float, float]] = None,
+                          rng: random.Random = None) -> List[List[Tuple[int, int]]]:
+        # Draw a fixed arrival stream indexed as arrivals[tick][intersection] = (ns, ew).
+        # Without rates this matches the default randint(0, 3) model, otherwise
+        # arrivals are Poisson with the given mean cars per tick.
+        rng = rng or random
+        arrivals = []
+        for _ in range(self.simulation_time):
+            tick = []
+            for i in range(self.num_intersections):
+                if rates is None:
+                    tick.append((rng.randint(0, 3), rng.randint(0, 3)))
+                else:
+                    ns_rate, ew_rate = rates[i]
+                    tick.append((self._poisson(rng, ns_rate), self._poisson(rng, ew_rate)))
+            arrivals.append(tick)
+        return arrivals
+
+    @staticmethod
+    def _poisson(rng, lam: float) -> int:
+        # Knuth's method, fine for the small per-tick rates used here
+        if lam <= 0:
+            return 0
+        limit = math.exp(-lam)
+        k = 0
+        p = rng.random()
+        while p > limit:
+            k += 1
+            p *= rng.random()
+        return k
+
+    def simulate_traffic(self, timing: List[int], gui_callback: Callable = None,
+                         arrivals: List[List[Tuple[int, int]]] = None,
+                         recorder: TrajectoryRecorder = None) -> float:
         lights = [self.TrafficLight(i) for i in range(self.num_intersections)]
         total_waiting_time = 0
         
@@ -130,68 +222,306 @@ class SimpleTrafficOptimizer:
                 light.ew_timing = timing[base_idx + 3:base_idx + 6]
                 
                 # Update light states based on timing
-                waiting_time = light.update()
+                if arrivals is not None:
+                    waiting_time = light.update(*arrivals[t][i])
+                else:
+                    waiting_time = light.update()
                 total_waiting_time += waiting_time
                 current_state.append(light.get_state())
             
+            if recorder:
+                recorder.record(lights)
+            
             if gui_callback and t % 5 == 0:
                 if not gui_callback(-1, -total_waiting_time, current_state):
                     return float('-inf')
         
         return -total_waiting_time
 
-    def optimize(self, gui_callback: Callable = None) -> tuple:
-        # Initialize random population of timing solutions
-        population = [self.create_individual() for _ in range(self.population_size)]
+    def simulate_microsim(self, population: List[List[int]], seed: int = None,
+                          gui_callback: Callable = None,
+                          recorder: TrajectoryRecorder = None) -> List[float]:
+        # Score plans on the car microsimulation; all plans share one spawn stream.
+        # The GUI is handed the engine itself so it draws the cars being scored.
+        import car_engine
+        if seed is None:
+            seed = random.getrandbits(32)
+        callback = None
+        if gui_callback or recorder:
+            def callback(t, engine, total):
+                if recorder:
+                    recorder.record_engine(engine)
+                return not gui_callback or t % 5 != 0 or gui_callback(-1, -int(total.sum()), engine)
+        return car_engine.simulate_batch(population, self.num_intersections, self.simulation_time,
+                                         self.microsim_spawn_rate, seed, callback)
+
+    def record_run(self, timing: List[int], path: str,
+                   arrivals: List[List[Tuple[int, int]]] = None) -> float:
+        # Simulate a plan once on the fitness backend and keep its per-tick trajectory for playback
+        with TrajectoryRecorder(path, self.num_intersections, self.simulation_time, timing) as recorder:
+            if self.fitness_backend == "microsim" and arrivals is None:
+                return self.simulate_microsim([timing], recorder=recorder)[0]
+            return self.simulate_traffic(timing, arrivals=arrivals, recorder=recorder)
+
+    def evaluate_population(self, population: List[List[int]],
+                            arrivals: List[List[Tuple[int, int]]] = None) -> List[float]:
+        # Score every individual against the same arrival stream, or against
+        # the scenario ensemble when one is configured
+        if arrivals is None:
+            # A remote evaluator only scores the queue model on one generated stream
+            if self.evaluator is not None and self.fitness_backend == "microsim":
+                raise ValueError("evaluator does not support the microsim fitness backend")
+            if self.evaluator is not None and self.scenario_ensemble is not None:
+                raise ValueError("evaluator does not support a scenario ensemble")
+            if self.fitness_backend == "microsim":
+                return self.simulate_microsim(population)
+            if self.scenario_ensemble is not None:
+                return self.scenario_ensemble.evaluate(population)
+            if self.evaluator is not None:
+                return self.evaluator.evaluate(population)
+            arrivals = self.generate_arrivals()
+        if self.use_compiled_kernel and sim_kernel.HAVE_NUMBA:
+            return sim_kernel.simulate_batch(population, arrivals)
+        return [self.simulate_traffic(individual, arrivals=arrivals) for individual in population]
+
+    def optimize(self, gui_callback: Callable = None,
+                 initial_population: Optional[List[List[int]]] = None) -> tuple:
+        # Memetic search re-simulates single intersections of the queue model on local demand
+        if self.memetic_budget > 0 and (gui_callback or self.fitness_backend != "queue"
+                                        or self.evaluator is not None):
+            raise ValueError("memetic_budget needs the queue fitness backend, "
+                             "without a GUI callback or remote evaluator")
+
+        # Initialize random population of timing solutions, topping up any warm start
+        population = [individual.copy() for individual in (initial_population or [])]
+        population = population[:self.population_size]
+        while len(population) < self.population_size:
+            population.append(self.create_individual())
         best_solution = None
         best_fitness = float('-inf')
         
+        # Convergence tracking
+        base_mutation_rate = self.mutation_rate
+        start_time = time.time()
+        evaluations = 0
+        individuals_scored = 0
+        refinement_trials = 0
+        # A memetic trial re-simulates one intersection, so num_intersections trials cost one evaluation
+        memetic_evaluations = self.memetic_budget // self.num_intersections
+        stagnation = 0
+        self.history = []
+        self.stop_reason = "generations"
+        scored = ([], [])
+        
         # Main genetic algorithm loop
         for generation in range(self.num_generations):
-            fitness_scores = []
+            previous_best = best_fitness
+
+            # Evaluate fitness of each individual; the GUI needs per-tick states,
+            # otherwise the generation is scored as one batch
+            if gui_callback:
+                # One plan at a time on the backend and demand the batch path would use
+                if self.fitness_backend == "microsim":
+                    seed = random.getrandbits(32)
+                    fitness_scores = [self.simulate_microsim([individual], seed, gui_callback)[0]
+                                      for individual in population]
+                else:
+                    arrivals = self.generate_arrivals()
+                    fitness_scores = [self.simulate_traffic(individual, gui_callback, arrivals)
+                                      for individual in population]
+            elif self.memetic_budget > 0:
+                # Local search reuses the demand streams the generation was scored on
+                if self.scenario_ensemble is not None:
+                    fitness_scores = self.scenario_ensemble.evaluate(population)
+                    streams = self.scenario_ensemble.streams
+                    combine = self.scenario_ensemble.aggregate
+                else:
+                    arrivals = self.generate_arrivals()
+                    fitness_scores = self.evaluate_population(population, arrivals)
+                    streams, combine = [arrivals], None
+                refinement_trials += self.refine_elites(population, fitness_scores, streams, combine)
+            else:
+                fitness_scores = self.evaluate_population(population)
+            individuals_scored += len(population)
+            evaluations = individuals_scored + refinement_trials // self.num_intersections
+            scored = (population, fitness_scores)
             
-            # Evaluate fitness of each individual
-            for individual in population:
-                fitness = self.simulate_traffic(individual, gui_callback)
-                fitness_scores.append(fitness)
-                
+            for individual, fitness in zip(population, fitness_scores):
                 # Track best solution found so far
                 if fitness > best_fitness:
                     best_fitness = fitness
                     best_solution = individual.copy()
             
+            if generation == 0 or best_fitness - previous_best > self.min_improvement:
+                stagnation = 0
+            else:
+                stagnation += 1
+            diversity = self.population_diversity(population)
+            
+            self.history.append({
+                'generation': generation,
+                'best_fitness': best_fitness,
+                'mean_fitness': sum(fitness_scores) / len(fitness_scores),
+                'diversity': diversity,
+                'mutation_rate': self.mutation_rate,
+                'evaluations': evaluations,
+                'refinement_trials': refinement_trials,
+                'elapsed': time.time() - start_time
+            })
+            
             # Update GUI with generation info
             if gui_callback:
                 if not gui_callback(generation, best_fitness, None):
+                    self.stop_reason = "stopped"
                     break
             
-            # Evolution step: Create new population
-            new_population = []
-            
-            # Elitism: Preserve best solutions
-            elite_indices = sorted(range(len(fitness_scores)), 
-                                key=lambda i: fitness_scores[i], 
-                                reverse=True)[:self.elite_size]
-            for idx in elite_indices:
-                new_population.append(population[idx].copy())
+            # Print progress
+            if self.verbose:
+                print(f"Generation {generation}: Best Fitness = {best_fitness}")
             
-            # Create rest of population through selection, crossover, mutation
-            while len(new_population) < self.population_size:
-                parent1, parent2 = self.select_parents(population, fitness_scores)
-                child = self.crossover(parent1, parent2)
-                child = self.mutate(child)
-                new_population.append(child)
+            # Early stopping
+            if self.patience is not None and stagnation >= self.patience:
+                self.stop_reason = "patience"
+            elif self.max_time is not None and time.time() - start_time >= self.max_time:
+                self.stop_reason = "time"
+            elif (self.max_evaluations is not None and
+                  evaluations + len(population) + memetic_evaluations > self.max_evaluations):
+                self.stop_reason = "evaluations"
+            if self.stop_reason != "generations":
+                if self.verbose:
+                    print(f"Stopping early after generation {generation}: {self.stop_reason}")
+                break
             
-            population = new_population
+            if self.adaptive_mutation:
+                self.mutation_rate = self.adapt_mutation_rate(base_mutation_rate, stagnation, diversity)
             
-            # Print progress
-            print(f"Generation {generation}: Best Fitness = {best_fitness}")
+            # Evolution step: Create new population
+            population = self.evolve_population(population, fitness_scores)
         
+        self.mutation_rate = base_mutation_rate
+        self.population = population
+        # The returned population may already be evolved past its scores
+        scored_population, scored_fitness = scored
+        ranked = sorted(range(len(scored_fitness)), key=lambda i: scored_fitness[i], reverse=True)
+        self.elites = [scored_population[i].copy() for i in ranked[:self.elite_size]]
         return best_solution, best_fitness
 
+    def gene_bounds(self, index: int) -> Tuple[int, int]:
+        # Genes repeat as green/yellow/red for NS then EW
+        if index % 3 == 0:
+            return self.min_green_time, self.max_green_time
+        if index % 3 == 1:
+            return self.min_yellow_time, self.max_yellow_time
+        return self.min_red_time, self.max_red_time
+
+    def refine_elites(self, population: List[List[int]], fitness_scores: List[float],
+                      streams: List[List[List[Tuple[int, int]]]], combine: Callable = None) -> int:
+        # Coordinate search on the elites, one intersection's six genes at a time.
+        # Intersections only interact through the total, so a trial move re-simulates
+        # just the intersection it touches against the fixed demand streams.
+        elite_indices = sorted(range(len(fitness_scores)),
+                               key=lambda i: fitness_scores[i],
+                               reverse=True)[:self.elite_size]
+        if not elite_indices:
+            return 0
+
+        num_ticks = len(streams[0])
+        columns = [sim_kernel.split_stream(stream) for stream in streams]
+        deltas = [sign * step for step in range(1, self.memetic_step + 1) for sign in (1, -1)]
+
+        def intersection_costs(genes: List[int], i: int) -> List[int]:
+            green_ns, green_ew = sim_kernel.light_schedule(genes, 1, num_ticks)[0]
+            return [sim_kernel.queue_cost(green_ns, green_ew, *stream_columns[i])
+                    for stream_columns in columns]
+
+        def fitness(costs: List[List[int]]) -> float:
+            per_stream = [-sum(costs[i][s] for i in range(len(costs))) for s in range(len(streams))]
+            return combine(per_stream) if combine else per_stream[0]
+
+        trials = 0
+        budget_per_elite = self.memetic_budget // len(elite_indices)
+        for idx in elite_indices:
+            genome = population[idx]
+            costs = [intersection_costs(genome[i * 6:i * 6 + 6], i) for i in range(self.num_intersections)]
+            current = fitness(costs)
+            used = 0
+            improved = True
+            while improved and used < budget_per_elite:
+                improved = False
+                for i in range(self.num_intersections):
+                    for gene in range(i * 6, i * 6 + 6):
+                        low, high = self.gene_bounds(gene)
+                        for delta in deltas:
+                            value = genome[gene] + delta
+                            if used >= budget_per_elite or not low <= value <= high:
+                                continue
+                            genes = genome[i * 6:i * 6 + 6]
+                            genes[gene - i * 6] = value
+                            trial_costs = costs[:i] + [intersection_costs(genes, i)] + costs[i + 1:]
+                            trial = fitness(trial_costs)
+                            used += 1
+                            # First improvement: keep the move and go on to the next gene
+                            if trial > current:
+                                genome[gene] = value
+                                costs, current = trial_costs, trial
+                                improved = True
+                                break
+            fitness_scores[idx] = current
+            trials += used
+        return trials
+
+    def gene_entropy(self, population: List[List[int]]) -> List[float]:
+        # Shannon entropy of each gene across the population, normalized to 0-1
+        ranges = [self.max_green_time - self.min_green_time + 1,
+                  self.max_yellow_time - self.min_yellow_time + 1,
+                  self.max_red_time - self.min_red_time + 1] * 2
+        entropies = []
+        for i in range(len(population[0])):
+            counts = {}
+            for individual in population:
+                counts[individual[i]] = counts.get(individual[i], 0) + 1
+            possible = min(ranges[i % 6], len(population))
+            if possible < 2:
+                entropies.append(0.0)
+                continue
+            entropy = -sum(c / len(population) * math.log(c / len(population)) for c in counts.values())
+            entropies.append(entropy / math.log(possible))
+        return entropies
+
+    def population_diversity(self, population: List[List[int]]) -> float:
+        entropies = self.gene_entropy(population)
+        return sum(entropies) / len(entropies)
+
+    def adapt_mutation_rate(self, base_rate: float, stagnation: int, diversity: float) -> float:
+        # Mutate more while the search is stuck or the population has collapsed,
+        # and fall back to the base rate as soon as it improves again
+        rate = base_rate * (1 + 0.5 * stagnation)
+        if diversity < self.diversity_threshold:
+            rate *= 1 + (self.diversity_threshold - diversity) / self.diversity_threshold
+        return min(self.max_mutation_rate, max(self.min_mutation_rate, rate))
+
+    def evolve_population(self, population: List[List[int]], fitness_scores: List[float]) -> List[List[int]]:
+        new_population = []
+        
+        # Elitism: Preserve best solutions
+        elite_indices = sorted(range(len(fitness_scores)), 
+                            key=lambda i: fitness_scores[i], 
+                            reverse=True)[:self.elite_size]
+        for idx in elite_indices:
+            new_population.append(population[idx].copy())
+        
+        # Create rest of population through selection, crossover, mutation
+        while len(new_population) < self.population_size:
+            parent1, parent2 = self.select_parents(population, fitness_scores)
+            child = self.crossover(parent1, parent2)
+            child = self.mutate(child)
+            new_population.append(child)
+        
+        return new_population
+
     def select_parents(self, population: List[List[int]], fitness_scores: List[float]) -> tuple:
         # Tournament selection
-        tournament_size = 3
+        tournament_size = min(self.tournament_size, len(fitness_scores))
         # Select random candidates for two tournaments
         tournament_1 = random.sample(list(enumerate(fitness_scores)), tournament_size)
         tournament_2 = random.sample(list(enumerate(fitness_scores)), tournament_size)
@@ -0,0 +1,268 @@
+import argparse
+import json
+import math
+import queue
+import random
+import socket
+import threading
+import time
+from collections import deque
+from typing import List, Dict, Callable, Iterable, Iterator, Tuple
+
+from simple_traffic_optimizer import SimpleTrafficOptimizer
+
+# Count updates are JSON lines such as {"t": 12.5, "intersection": 0, "ns": 3, "ew": 1}
+# where ns/ew are the cars counted on each approach since the previous update.
+
+
+class DemandWindow:
+    def __init__(self, num_intersections: int, window_seconds: float = 60.0, default_rate: float = 1.5):
+        self.num_intersections = num_intersections
+        self.window_seconds = window_seconds
+        self.default_rate = default_rate  # Mean of the randint(0, 3) model, used until data arrives
+        self.updates = deque()
+        self.first_seen = None
+        self.latest = None
+
+    def add(self, timestamp: float, intersection: int, ns: int, ew: int):
+        if not 0 <= intersection < self.num_intersections:
+            return
+        if self.first_seen is None:
+            self.first_seen = timestamp
+        self.latest = timestamp if self.latest is None else max(self.latest, timestamp)
+        self.updates.append((timestamp, intersection, ns, ew))
+        self.expire(self.latest)
+
+    def expire(self, now: float):
+        # Drop counts that have slid out of the window
+        while self.updates and self.updates[0][0] <= now - self.window_seconds:
+            self.updates.popleft()
+
+    def rates(self) -> List[Tuple[float, float]]:
+        # Cars per second on each approach; one simulation tick is one second
+        if self.latest is None:
+            return [(self.default_rate, self.default_rate)] * self.num_intersections
+
+        span = min(self.window_seconds, max(1.0, self.latest - self.first_seen))
+        totals = [[0, 0] for _ in range(self.num_intersections)]
+        seen = [False] * self.num_intersections
+        for _, intersection, ns, ew in self.updates:
+            totals[intersection][0] += ns
+            totals[intersection][1] += ew
+            seen[intersection] = True
+
+        return [(ns / span, ew / span) if seen[i] else (self.default_rate, self.default_rate)
+                for i, (ns, ew) in enumerate(totals)]
+
+
+def parse_update(update) -> tuple:
+    # (t, intersection, ns, ew) for a well-formed update, otherwise None
+    if not isinstance(update, dict):
+        return None
+    fields = [update.get('t', time.time()), update.get('intersection'), update.get('ns', 0), update.get('ew', 0)]
+    if any(isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value)
+           for value in fields):
+        return None
+    t, intersection, ns, ew = fields
+    if intersection != int(intersection) or ns < 0 or ew < 0:
+        return None
+    return float(t), int(intersection), int(ns), int(ew)
+
+
+def parse_line(line: str, require_time: bool = False) -> Dict:
+    # Normalized update for one JSON line, or None (after logging it) if the line is malformed
+    try:
+        update = json.loads(line)
+    except ValueError:
+        update = None
+    parsed = parse_update(update)
+    if parsed is None or (require_time and 't' not in update):
+        print(f"Ignoring malformed update: {line!r}")
+        return None
+    t, intersection, ns, ew = parsed
+    return {'t': t, 'intersection': intersection, 'ns': ns, 'ew': ew}
+
+
+def replay_file(path: str, speed: float = 1.0) -> Iterator[Dict]:
+    # Replay recorded count updates, pacing them by their timestamps
+    start_wall = time.time()
+    start_t = None
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            # Pacing needs the recorded timestamp, so updates without one are skipped too
+            update = parse_line(line, require_time=True)
+            if update is None:
+                continue
+            if start_t is None:
+                start_t = update['t']
+            if speed > 0:
+                delay = (update['t'] - start_t) / speed - (time.time() - start_wall)
+                if delay > 0:
+                    time.sleep(delay)
+            yield update
+
+
+def socket_source(host: str = "127.0.0.1", port: int = 9750,
+                  stop_event: threading.Event = None) -> Iterator[Dict]:
+    # Accept line-delimited JSON count updates from any number of local clients
+    updates = queue.Queue()
+    stop_event = stop_event or threading.Event()
+    server = socket.create_server((host, port))
+    server.settimeout(0.5)
+
+    def handle(conn):
+        with conn, conn.makefile('r') as reader:
+            for line in reader:
+                line = line.strip()
+                if not line:
+                    continue
+                update = parse_line(line)
+                if update is not None:
+                    updates.put(update)
+
+    def accept():
+        with server:
+            while not stop_event.is_set():
+                try:
+                    conn, _ = server.accept()
+                except socket.timeout:
+                    continue
+                threading.Thread(target=handle, args=(conn,), daemon=True).start()
+
+    threading.Thread(target=accept, daemon=True).start()
+    while not stop_event.is_set():
+        try:
+            yield updates.get(timeout=0.5)
+        except queue.Empty:
+            continue
+
+
+class StreamingOptimizer:
+    def __init__(self, optimizer: SimpleTrafficOptimizer = None, window_seconds: float = 60.0,
+                 publish_interval: float = 5.0, on_publish: Callable = None, seed: int = None):
+        self.optimizer = optimizer or SimpleTrafficOptimizer()
+        self.window = DemandWindow(self.optimizer.num_intersections, window_seconds)
+        self.publish_interval = publish_interval
+        self.on_publish = on_publish
+        self.rng = random.Random(seed)
+        self.pending = queue.Queue()
+
+        # Live population carried over between windows instead of regenerated
+        self.population = [self.optimizer.create_individual()
+                           for _ in range(self.optimizer.population_size)]
+        self.best_solution = None
+        self.best_fitness = float('-inf')
+        self.generations = 0
+
+    def feed(self, update: Dict):
+        # Thread-safe entry point for count updates
+        self.pending.put(update)
+
+    def drain(self) -> int:
+        count = 0
+        while True:
+            try:
+                update = self.pending.get_nowait()
+            except queue.Empty:
+                return count
+            parsed = parse_update(update)
+            if parsed is None:
+                print(f"Ignoring malformed update: {update!r}")
+                continue
+            self.window.add(*parsed)
+            count += 1
+
+    def step(self) -> tuple:
+        # Evolve the live population against the current demand estimate and
+        # publish the best plan before the latency budget runs out
+        start = time.time()
+        deadline = start + self.publish_interval
+        self.drain()
+        rates = self.window.rates()
+
+        # One arrival stream per window so carried-over plans are re-scored fairly
+        arrivals = self.optimizer.generate_arrivals(rates, self.rng)
+        fitness_scores = self.optimizer.evaluate_population(self.population, arrivals)
+
+        generation_time = time.time() - start
+        while time.time() + generation_time < deadline:
+            generation_start = time.time()
+            self.population = self.optimizer.evolve_population(self.population, fitness_scores)
+            fitness_scores = self.optimizer.evaluate_population(self.population, arrivals)
+            self.generations += 1
+            generation_time = time.time() - generation_start
+
+        best_idx = max(range(len(fitness_scores)), key=lambda i: fitness_scores[i])
+        self.best_solution = self.population[best_idx].copy()
+        self.best_fitness = fitness_scores[best_idx]
+
+        if self.on_publish:
+            self.on_publish(self.best_solution, self.best_fitness, rates)
+        return self.best_solution, self.best_fitness
+
+    def run(self, source: Iterable[Dict] = None, stop_event: threading.Event = None):
+        stop_event = stop_event or threading.Event()
+        source_done = threading.Event()
+
+        def ingest():
+            try:
+                for update in source:
+                    if stop_event.is_set():
+                        break
+                    self.feed(update)
+            finally:
+                source_done.set()
+
+        if source is not None:
+            threading.Thread(target=ingest, daemon=True).start()
+        else:
+            source_done.set()
+
+        # Keep publishing until stopped, or until a finite source is used up
+        while not stop_event.is_set():
+            self.step()
+            if source is not None and source_done.is_set() and self.pending.empty():
+                break
+
+
+def print_plan(plan: List[int], fitness: float, rates: List[Tuple[float, float]]):
+    print(json.dumps({
+        'time': time.time(),
+        'fitness': fitness,
+        'rates': [[round(ns, 3), round(ew, 3)] for ns, ew in rates],
+        'plan': plan
+    }), flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Continuously re-optimize signal plans from streaming counts")
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--replay", help="JSON-lines file of count updates to replay")
+    group.add_argument("--listen", help="host:port to accept JSON-lines count updates on")
+    parser.add_argument("--speed", type=float, default=1.0, help="Replay speed multiplier (0 = no pacing)")
+    parser.add_argument("--intersections", type=int, default=4)
+    parser.add_argument("--window", type=float, default=60.0, help="Sliding demand window in seconds")
+    parser.add_argument("--interval", type=float, default=5.0, help="Seconds between published plans")
+    args = parser.parse_args()
+
+    optimizer = SimpleTrafficOptimizer()
+    optimizer.num_intersections = args.intersections
+    streamer = StreamingOptimizer(optimizer, args.window, args.interval, on_publish=print_plan)
+
+    stop_event = threading.Event()
+    if args.replay:
+        source = replay_file(args.replay, args.speed)
+    else:
+        host, port = args.listen.rsplit(":", 1)
+        source = socket_source(host, int(port), stop_event)
+
+    try:
+        streamer.run(source, stop_event)
+    except KeyboardInterrupt:
+        stop_event.set()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+import argparse
+import json
+import math
+import random
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from typing import List, Dict
+
+import sim_kernel
+from scenarios import Scenario, ScenarioEnsemble
+from simple_traffic_optimizer import SimpleTrafficOptimizer
+
+
+def diurnal_scenarios(num_periods: int = 24, base_rate: float = 1.5) -> List[Scenario]:
+    # Demand per period with an NS-heavy morning peak and an EW-heavy evening peak
+    scenarios = []
+    for period in range(num_periods):
+        hour = (period + 0.5) * 24 / num_periods
+        morning = math.exp(-((hour - 8.0) / 1.5) ** 2)
+        evening = math.exp(-((hour - 17.5) / 1.5) ** 2)
+        night = 0.5 if hour < 6 or hour >= 22 else 1.0
+        ns_rate = base_rate * night * (0.5 + 0.9 * morning + 0.4 * evening)
+        ew_rate = base_rate * night * (0.5 + 0.4 * morning + 0.9 * evening)
+        scenarios.append(Scenario(period_label(period, num_periods), ns_rate, ew_rate))
+    return scenarios
+
+
+def period_label(period: int, num_periods: int) -> str:
+    minutes = period * 24 * 60 // num_periods
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+def _evolve_period(settings: Dict, scenario: Scenario, population: List[List[int]],
+                   generations: int, seed: int) -> Dict:
+    random.seed(seed)
+    optimizer = SimpleTrafficOptimizer()
+    optimizer.apply_settings(settings)
+    optimizer.num_generations = generations
+    optimizer.verbose = False
+    optimizer.scenario_ensemble = ScenarioEnsemble(optimizer, [scenario], seed=seed)
+
+    best_solution, best_fitness = optimizer.optimize(initial_population=population)
+    return {
+        'best_solution': best_solution,
+        'best_fitness': best_fitness,
+        'population': optimizer.population,
+        'elites': optimizer.elites
+    }
+
+
+def optimize_schedule(scenarios: List[Scenario] = None, optimizer: SimpleTrafficOptimizer = None,
+                      rounds: int = 4, generations_per_round: int = 5, migrants: int = 2,
+                      workers: int = None, seed: int = None) -> List[Dict]:
+    # Evolve one plan per period in parallel. Whenever a period finishes a round,
+    # its next round is seeded with the latest elites of the neighbouring periods.
+    # Rounds score on freshly drawn demand, so each period's round winners are
+    # compared on one fixed stream at the end.
+    scenarios = scenarios or diurnal_scenarios()
+    optimizer = optimizer or SimpleTrafficOptimizer()
+    settings = optimizer.settings()
+    num_periods = len(scenarios)
+    rng = random.Random(seed)
+
+    populations = [None] * num_periods
+    elites = [[] for _ in range(num_periods)]
+    candidates = [[] for _ in range(num_periods)]
+    rounds_done = [0] * num_periods
+
+    def seeded_population(period: int) -> List[List[int]]:
+        if populations[period] is None:
+            return None
+        neighbours = {(period - 1) % num_periods, (period + 1) % num_periods} - {period}
+        incoming = [individual for neighbour in neighbours for individual in elites[neighbour][:migrants]]
+        # Migrants go first so they survive the truncation to population_size
+        return incoming + populations[period]
+
+    with ProcessPoolExecutor(workers, initializer=sim_kernel.single_threaded) as pool:
+        def submit(period: int):
+            return pool.submit(_evolve_period, settings, scenarios[period], seeded_population(period),
+                               generations_per_round, rng.randrange(2 ** 32))
+
+        futures = {submit(period): period for period in range(num_periods)}
+        while futures:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                period = futures.pop(future)
+                result = future.result()
+                populations[period] = result['population']
+                elites[period] = result['elites']
+                candidates[period].append(result['best_solution'])
+
+                rounds_done[period] += 1
+                print(f"Period {scenarios[period].name} round {rounds_done[period]}: "
+                      f"Best Fitness = {result['best_fitness']}")
+                if rounds_done[period] < rounds:
+                    futures[submit(period)] = period
+
+    best = []
+    for period, scenario in enumerate(scenarios):
+        ensemble = ScenarioEnsemble(optimizer, [scenario], resample=False, seed=rng.randrange(2 ** 32))
+        scores = ensemble.evaluate(candidates[period])
+        winner = max(range(len(scores)), key=lambda i: scores[i])
+        best.append((candidates[period][winner], scores[winner]))
+
+    return [{
+        'period': period,
+        'start': period_label(period, num_periods),
+        'end': period_label((period + 1) % num_periods, num_periods),
+        'scenario': scenarios[period].name,
+        'fitness': best[period][1],
+        'plan': best[period][0]
+    } for period in range(num_periods)]
+
+
+def write_schedule(path: str, schedule: List[Dict], num_intersections: int):
+    with open(path, 'w') as f:
+        json.dump({'num_intersections': num_intersections, 'periods': schedule}, f, indent=2)
+
+
+def load_schedule(path: str) -> List[Dict]:
+    with open(path) as f:
+        return json.load(f)['periods']
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Optimize a time-of-day signal plan schedule")
+    parser.add_argument("--periods", type=int, default=24)
+    parser.add_argument("--intersections", type=int, default=4)
+    parser.add_argument("--rounds", type=int, default=4)
+    parser.add_argument("--generations-per-round", type=int, default=5)
+    parser.add_argument("--migrants", type=int, default=2, help="Elites taken from each neighbouring period")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--output", default="plan_schedule.json")
+    args = parser.parse_args()
+
+    optimizer = SimpleTrafficOptimizer()
+    optimizer.num_intersections = args.intersections
+    schedule = optimize_schedule(diurnal_scenarios(args.periods), optimizer, args.rounds,
+                                 args.generations_per_round, args.migrants, args.workers, args.seed)
+    write_schedule(args.output, schedule, args.intersections)
+    print(f"Wrote {len(schedule)} periods to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -1,24 +1,20 @@
 import tkinter as tk
-from tkinter import ttk
-import random
+from tkinter import ttk, filedialog
 import time
 from typing import List
 import threading
 from PIL import Image, ImageTk
 from simple_traffic_optimizer import SimpleTrafficOptimizer
+from trajectory_recorder import TrajectoryReader
+import car_engine
 import math
 
 class Car:
-    def __init__(self, canvas, x, y, direction, lane, intersection_id):
+    # Canvas sprite for one car; positions come from the shared CarEngine
+    def __init__(self, canvas, x, y, direction):
         self.canvas = canvas
         self.size = 15
         self.direction = direction
-        self.lane = lane
-        self.intersection_id = intersection_id
-        self.passed_intersection = False
-        
-        # Minimum spacing between cars
-        self.min_spacing = 30
         
         if direction == 'NS':
             points = self.create_car_points(x, y, vertical=True)
@@ -31,10 +27,6 @@ class Car:
         
         self.x = x
         self.y = y
-        self.speed = 4  # Increased speed
-        self.waiting = False
-        self.stop_line = None
-        self.stuck_time = 0  # Add stuck time counter
 
     def create_car_points(self, x, y, vertical=True):
         if vertical:
@@ -55,107 +47,30 @@ class Car:
             ]
         return points
 
-    def set_stop_line(self, x, y):
-        if self.direction == 'NS':
-            self.stop_line = y - 20 if self.lane == 'incoming' else y + 20
-        else:
-            self.stop_line = x - 20 if self.lane == 'incoming' else x + 20
-
-    def move(self, light_state, other_cars):
-        # Reset stuck counter if moving
-        if not self.waiting:
-            self.stuck_time = 0
-            
-        should_stop = light_state != 'GREEN' and not self.passed_intersection
-        
-        # Check for collision with other cars
-        too_close = False
-        for car in other_cars:
-            if car != self and not car.passed_intersection:
-                if self.would_collide(car):
-                    too_close = True
-                    break
-        
-        if self.direction == 'NS':
-            if (should_stop and self.y + self.speed >= self.stop_line) or too_close:
-                self.waiting = True
-                self.stuck_time += 1
-                return self.stuck_time < 200  # Remove if stuck too long
-            
-            if light_state == 'GREEN':
-                self.waiting = False
-            
-            if not self.waiting:
-                self.y += self.speed
-                self.canvas.move(self.shape, 0, self.speed)
-                
-                if self.y > self.stop_line:
-                    self.passed_intersection = True
-                
-                if self.y > self.stop_line + 80:  # Increased removal distance
-                    return False
-                
-        else:  # EW
-            if (should_stop and self.x + self.speed >= self.stop_line) or too_close:
-                self.waiting = True
-                self.stuck_time += 1
-                return self.stuck_time < 200  # Remove if stuck too long
-            
-            if light_state == 'GREEN':
-                self.waiting = False
-            
-            if not self.waiting:
-                self.x += self.speed
-                self.canvas.move(self.shape, self.speed, 0)
-                
-                if self.x > self.stop_line:
-                    self.passed_intersection = True
-                
-                if self.x > self.stop_line + 80:  # Increased removal distance
-                    return False
-        
-        return True
+    def move_to(self, x, y):
+        self.canvas.move(self.shape, x - self.x, y - self.y)
+        self.x = x
+        self.y = y
 
-    def check_bounds(self):
-        coords = self.canvas.coords(self.shape)
-        canvas_width = self.canvas.winfo_width()
-        canvas_height = self.canvas.winfo_height()
-        
-        if (min(coords[::2]) > canvas_width or max(coords[::2]) < 0 or
-            min(coords[1::2]) > canvas_height or max(coords[1::2]) < 0):
-            self.canvas.delete(self.shape)
-            return False
-        return True
-
-    def would_collide(self, other_car):
-        if self.direction != other_car.direction:
-            return False
-            
-        if self.direction == 'NS':
-            # More strict collision detection for NS traffic
-            return (abs(self.y - other_car.y) < self.min_spacing * 1.2 and 
-                   abs(self.x - other_car.x) < self.size)
-        else:
-            # More strict collision detection for EW traffic
-            return (abs(self.x - other_car.x) < self.min_spacing * 1.2 and 
-                   abs(self.y - other_car.y) < self.size)
+    def delete(self):
+        self.canvas.delete(self.shape)
 
 class IntersectionDisplay:
-    def __init__(self, canvas, x, y, size=200, intersection_id=0):
+    def __init__(self, canvas, engine, x, y, size=200, intersection_id=0):
         self.canvas = canvas
+        self.engine = engine
         self.x = x
         self.y = y
         self.size = size
         self.intersection_id = intersection_id
-        self.cars = []
+        self.cars = {}  # Engine car id -> sprite
         
-        # Add timing variables
-        self.current_phase = 0
-        self.phase_time = 0
+        # Timings shown on the canvas and pushed into the engine
         self.timings = {
             'NS': [30, 3, 30],  # Green, Yellow, Red
             'EW': [30, 3, 30]   # Green, Yellow, Red
         }
+        self.engine.set_intersection_timing(intersection_id, self.timings['NS'] + self.timings['EW'])
         
         self.draw_intersection()
         self.draw_stop_lines()
@@ -191,9 +106,6 @@ class IntersectionDisplay:
             text="NS: G:30 Y:3 R:30\nEW: G:30 Y:3 R:30",
             anchor='center'
         )
-        
-        self.last_spawn_time = {'NS': 0, 'EW': 0}
-        self.spawn_cooldown = 20  # Frames between spawn attempts
 
     def draw_intersection(self):
         # Road
@@ -245,133 +157,84 @@ class IntersectionDisplay:
     def update_timing(self, timing_text):
         self.canvas.itemconfig(self.timing_display, text=timing_text)
 
-    def add_car(self, direction):
-        # Add spacing check before creating new car
+    def lane_origin(self, direction):
+        # Canvas position of the lane's spawn point; engine positions are measured from here
         if direction == 'NS':
-            x = self.x + self.size/2
-            y = self.y - self.size/2 - 40  # Increased starting distance
-            
-            # Check for existing cars in spawn area
-            if any(car.direction == 'NS' and abs(car.y - y) < self.size * 1.5 
-                  for car in self.cars):
-                return
-                
-        else:
-            x = self.x - self.size/2 - 40  # Increased starting distance
-            y = self.y + self.size/2
-            
-            # Check for existing cars in spawn area
-            if any(car.direction == 'EW' and abs(car.x - x) < self.size * 1.5 
-                  for car in self.cars):
-                return
-        
-        car = Car(self.canvas, x, y, direction, 'incoming', self.intersection_id)
-        car.set_stop_line(self.x, self.y)
-        self.cars.append(car)
-
-    def update_cars(self, ns_state, ew_state):
-        current_time = time.time() * 1000
-        
-        # Add new cars with strict spacing control
-        if len(self.cars) < 10:  # Reduced max cars for better control
-            # Check NS direction with strict spacing
-            if (current_time - self.last_spawn_time['NS'] > self.spawn_cooldown and 
-                random.random() < 0.12):
-                if not any(car.direction == 'NS' and 
-                          abs(car.y - (self.y - self.size/2)) < self.size 
-                          for car in self.cars):
-                    self.add_car('NS')
-                    self.last_spawn_time['NS'] = current_time
-            
-            # Check EW direction with strict spacing
-            if (current_time - self.last_spawn_time['EW'] > self.spawn_cooldown and 
-                random.random() < 0.12):
-                if not any(car.direction == 'EW' and 
-                          abs(car.x - (self.x - self.size/2)) < self.size 
-                          for car in self.cars):
-                    self.add_car('EW')
-                    self.last_spawn_time['EW'] = current_time
-        
-        # Update existing cars with collision prevention
-        remaining_cars = []
-        for car in self.cars:
-            # Check if car can move without collision
-            can_move = True
-            for other_car in self.cars:
-                if car != other_car and car.would_collide(other_car):
-                    if not car.waiting:  # Only set waiting if not already waiting
-                        car.waiting = True
-                    can_move = False
-                    break
-            
-            if can_move:
-                car.waiting = False
-            
-            if car.move(ns_state if car.direction == 'NS' else ew_state, self.cars):
-                remaining_cars.append(car)
-            else:
-                self.canvas.delete(car.shape)
-        
-        self.cars = remaining_cars
-        
-        # Update queue displays
-        ns_queue = len([car for car in self.cars if car.direction == 'NS' and car.waiting])
-        ew_queue = len([car for car in self.cars if car.direction == 'EW' and car.waiting])
-        
-        self.canvas.itemconfig(self.queue_displays['NS'], text=f"NS: {ns_queue}")
-        self.canvas.itemconfig(self.queue_displays['EW'], text=f"EW: {ew_queue}")
+            return self.x + self.size/2, self.y - self.size/2 - 40
+        return self.x - self.size/2 - 40, self.y + self.size/2
 
-    def can_add_car(self, direction):
-        # Implementation of can_add_car method
-        pass
+    def update_cars(self):
+        # Sync sprites with the engine: create new cars, move existing ones, drop removed ones
+        current = set()
+        for direction, offset in (('NS', car_engine.NS), ('EW', car_engine.EW)):
+            origin_x, origin_y = self.lane_origin(direction)
+            car_ids, positions = self.engine.lane_cars(self.intersection_id * 2 + offset)
+            for car_id, position in zip(car_ids.tolist(), positions.tolist()):
+                if direction == 'NS':
+                    x, y = origin_x, origin_y + position
+                else:
+                    x, y = origin_x + position, origin_y
+                
+                if car_id in self.cars:
+                    self.cars[car_id].move_to(x, y)
+                else:
+                    self.cars[car_id] = Car(self.canvas, x, y, direction)
+                current.add(car_id)
+        
+        for car_id in list(self.cars):
+            if car_id not in current:
+                self.cars.pop(car_id).delete()
 
     def update_timings(self, new_timings):
         if len(new_timings) >= 6:
-            self.timings['NS'] = new_timings[0:3]
-            self.timings['EW'] = new_timings[3:6]
+            self.timings['NS'] = list(new_timings[0:3])
+            self.timings['EW'] = list(new_timings[3:6])
+            self.engine.set_intersection_timing(self.intersection_id, new_timings[0:6])
             self.update_timing_display()
 
+    def set_engine(self, engine):
+        # Follow another engine, such as the one a candidate plan is being scored on
+        if engine is not self.engine:
+            self.clear_cars()
+            self.engine = engine
+        timing = engine.timings[self.intersection_id].tolist()
+        self.timings['NS'] = timing[0:3]
+        self.timings['EW'] = timing[3:6]
+        self.update_timing_display()
+
+    def show_state(self, state):
+        # Queue-model state from simulate_traffic; it has no individual cars to draw
+        self.clear_cars()
+        self.update_timings([int(value) for value in state['ns_timing'].split('/')] +
+                            [int(value) for value in state['ew_timing'].split('/')])
+        self.update_lights(state['ns_state'], state['ew_state'])
+        self.update_queues(state['queue_ns'], state['queue_ew'])
+
+    def clear_cars(self):
+        for car in self.cars.values():
+            car.delete()
+        self.cars = {}
+
     def update_timing_display(self):
         text = f"NS: G:{self.timings['NS'][0]} Y:{self.timings['NS'][1]} R:{self.timings['NS'][2]}\n"
         text += f"EW: G:{self.timings['EW'][0]} Y:{self.timings['EW'][1]} R:{self.timings['EW'][2]}"
         self.canvas.itemconfig(self.timing_display, text=text)
 
     def update(self):
-        self.phase_time += 1
+        # Render the current state of the engine this display follows
         ns_state = self.get_light_state('NS')
         ew_state = self.get_light_state('EW')
         
         self.update_lights(ns_state, ew_state)
-        self.update_cars(ns_state, ew_state)
-        
-        # Reset phase time if cycle complete
-        total_cycle_time = sum(self.timings['NS'])
-        if self.phase_time >= total_cycle_time:
-            self.phase_time = 0
-            self.current_phase = (self.current_phase + 1) % 2
+        self.update_cars()
+        self.update_queues(*self.get_queue_lengths())
 
     def get_light_state(self, direction):
-        cycle_time = self.phase_time % sum(self.timings[direction])
-        timings = self.timings[direction]
-        
-        if direction == 'NS':
-            phase_offset = 0
-        else:
-            phase_offset = sum(self.timings['NS']) // 2
-        
-        adjusted_time = (cycle_time + phase_offset) % sum(timings)
-        
-        if adjusted_time < timings[0]:
-            return 'GREEN'
-        elif adjusted_time < timings[0] + timings[1]:
-            return 'YELLOW'
-        else:
-            return 'RED'
+        states = self.engine.light_states()[self.intersection_id]
+        return car_engine.STATE_NAMES[states[car_engine.NS if direction == 'NS' else car_engine.EW]]
 
     def get_queue_lengths(self):
-        ns_queue = len([car for car in self.cars if car.direction == 'NS' and car.waiting])
-        ew_queue = len([car for car in self.cars if car.direction == 'EW' and car.waiting])
-        return [ns_queue, ew_queue]
+        return self.engine.queue_lengths()[self.intersection_id].tolist()
 
 class TrafficSimulatorGUI:
     def __init__(self, root):
@@ -383,13 +246,20 @@ class TrafficSimulatorGUI:
         self.optimizer = SimpleTrafficOptimizer()
         self.is_running = False
         
+        # Playback of recorded runs
+        self.recording_path = "best_run.trj"
+        self.player = None
+        self.playback_tick = 0
+        self.playback_job = None
+        
         # Initialize parameter variables
         self.param_vars = {
             "num_intersections": tk.StringVar(value="4"),
             "population_size": tk.StringVar(value="30"),
             "generations": tk.StringVar(value="50"),
             "mutation_rate": tk.StringVar(value="0.1"),
-            "crossover_rate": tk.StringVar(value="0.8")
+            "crossover_rate": tk.StringVar(value="0.8"),
+            "fitness_backend": tk.StringVar(value="microsim")
         }
         
         # Create main container with description
@@ -452,6 +322,14 @@ class TrafficSimulatorGUI:
             ttk.Entry(frame, textvariable=self.param_vars[var_name], width=10).pack(side=tk.LEFT, padx=5)
             ttk.Label(frame, text=description, font=('Helvetica', 8)).pack(side=tk.LEFT)
         
+        # The car microsimulation is the model the canvas animates
+        frame = ttk.Frame(params_frame)
+        frame.pack(fill=tk.X, pady=2)
+        ttk.Label(frame, text="Fitness Backend:").pack(side=tk.LEFT)
+        ttk.Combobox(frame, textvariable=self.param_vars["fitness_backend"], values=("microsim", "queue"),
+                     state="readonly", width=9).pack(side=tk.LEFT, padx=5)
+        ttk.Label(frame, text="Car microsimulation or queue model", font=('Helvetica', 8)).pack(side=tk.LEFT)
+        
         # Statistics frame
         self.stats_frame = ttk.LabelFrame(self.control_frame, text="Real-time Statistics", padding="10")
         self.stats_frame.pack(fill=tk.X, pady=5)
@@ -473,6 +351,32 @@ class TrafficSimulatorGUI:
                   command=self.start_optimization).pack(side=tk.LEFT, padx=5)
         ttk.Button(buttons_frame, text="Stop", 
                   command=self.stop_optimization).pack(side=tk.LEFT)
+        
+        # Playback frame
+        playback_frame = ttk.LabelFrame(self.control_frame, text="Playback", padding="10")
+        playback_frame.pack(fill=tk.X, pady=5)
+        
+        playback_buttons = ttk.Frame(playback_frame)
+        playback_buttons.pack(fill=tk.X, pady=2)
+        ttk.Button(playback_buttons, text="Load Recording", 
+                  command=self.load_recording).pack(side=tk.LEFT, padx=5)
+        ttk.Button(playback_buttons, text="Replay Best Run", 
+                  command=lambda: self.load_recording(self.recording_path)).pack(side=tk.LEFT)
+        ttk.Button(playback_buttons, text="Play/Pause", 
+                  command=self.toggle_playback).pack(side=tk.LEFT, padx=5)
+        
+        speed_frame = ttk.Frame(playback_frame)
+        speed_frame.pack(fill=tk.X, pady=2)
+        self.playback_speed = tk.StringVar(value="10")
+        ttk.Label(speed_frame, text="Speed:").pack(side=tk.LEFT)
+        ttk.Entry(speed_frame, textvariable=self.playback_speed, width=10).pack(side=tk.LEFT, padx=5)
+        ttk.Label(speed_frame, text="Ticks per second", font=('Helvetica', 8)).pack(side=tk.LEFT)
+        
+        self.seek_scale = ttk.Scale(playback_frame, from_=0, to=0, orient=tk.HORIZONTAL, 
+                                    command=self.seek_playback)
+        self.seek_scale.pack(fill=tk.X, pady=2)
+        self.playback_label = ttk.Label(playback_frame, text="Tick: -")
+        self.playback_label.pack(anchor=tk.W)
 
     def setup_visualization(self):
         viz_container = ttk.LabelFrame(self.horizontal_container, text="Traffic Simulation", padding="10")
@@ -503,7 +407,6 @@ class TrafficSimulatorGUI:
         self.canvas.bind('<MouseWheel>', self._on_mousewheel)
         self.canvas.bind('<Shift-MouseWheel>', self._on_shift_mousewheel)
         
-        self.intersections = []
         self.create_intersection_grid()
 
     def _on_mousewheel(self, event):
@@ -517,6 +420,8 @@ class TrafficSimulatorGUI:
     def create_intersection_grid(self):
         num_intersections = int(self.param_vars["num_intersections"].get())
         grid_size = math.ceil(math.sqrt(num_intersections))
+        self.intersections = []
+        self.engine = car_engine.CarEngine(num_intersections)
         
         # Increased spacing between intersections
         spacing_x = 400  # Increased from 300
@@ -534,7 +439,7 @@ class TrafficSimulatorGUI:
                 x = start_x + col * spacing_x
                 y = start_y + row * spacing_y
                 
-                intersection = IntersectionDisplay(self.canvas, x, y, 
+                intersection = IntersectionDisplay(self.canvas, self.engine, x, y, 
                                                 intersection_id=intersection_id)
                 self.intersections.append(intersection)
                 intersection_id += 1
@@ -549,16 +454,9 @@ class TrafficSimulatorGUI:
                 self.stats_labels['generation'].config(text=f"Generation: {generation}")
             self.stats_labels['fitness'].config(text=f"Best Fitness: {-best_fitness:.2f}")
             
-            # Calculate current waiting time
-            current_waiting = sum(sum(lengths) for lengths in 
-                                (intersection.get_queue_lengths() 
-                                 for intersection in self.intersections))
-            self.stats_labels['current_waiting'].config(
-                text=f"Current Waiting Time: {current_waiting}")
-            
-            # Update each intersection
-            for intersection in self.intersections:
-                intersection.update()
+            # Per-generation updates carry no simulation state
+            if current_state is not None:
+                self.show_candidate(current_state)
             
             self.root.update()
             time.sleep(0.05)  # Small delay for visualization
@@ -568,8 +466,24 @@ class TrafficSimulatorGUI:
             print(f"GUI update error: {e}")
             return False
     
+    def show_candidate(self, current_state):
+        # Draw the plan being scored: the microsim passes its car engine,
+        # the queue model passes per-intersection light and queue states
+        if isinstance(current_state, car_engine.CarEngine):
+            for intersection in self.intersections:
+                intersection.set_engine(current_state)
+                intersection.update()
+            current_waiting = int(current_state.queue_lengths().sum())
+        else:
+            for intersection, state in zip(self.intersections, current_state):
+                intersection.show_state(state)
+            current_waiting = sum(state['queue_ns'] + state['queue_ew'] for state in current_state)
+        self.stats_labels['current_waiting'].config(
+            text=f"Current Waiting Time: {current_waiting}")
+    
     def start_optimization(self):
         if not self.is_running:
+            self.close_player()
             self.is_running = True
             self.canvas.delete("all")  # Clear the canvas
             self.create_intersection_grid()  # Create new grid
@@ -581,6 +495,7 @@ class TrafficSimulatorGUI:
                 self.optimizer.num_generations = int(self.param_vars["generations"].get())
                 self.optimizer.mutation_rate = float(self.param_vars["mutation_rate"].get())
                 self.optimizer.crossover_rate = float(self.param_vars["crossover_rate"].get())
+                self.optimizer.fitness_backend = self.param_vars["fitness_backend"].get()
                 
                 # Start optimization in a new thread
                 threading.Thread(target=self.run_optimization, daemon=True).start()
@@ -603,11 +518,105 @@ class TrafficSimulatorGUI:
                     intersection.update_timings(
                         best_solution[base_idx:base_idx + 6])
                 
+                # Record the best plan so it can be replayed without re-simulating
+                self.optimizer.record_run(best_solution, self.recording_path)
+                
                 self.show_final_results(best_solution, best_fitness)
+            self.is_running = False
         except Exception as e:
             print(f"Optimization error: {e}")
             self.is_running = False
     
+    def load_recording(self, path=None):
+        if self.is_running:
+            return
+        
+        path = path or filedialog.askopenfilename(
+            title="Open Recording", 
+            filetypes=[("Trajectory files", "*.trj"), ("All files", "*.*")])
+        if not path:
+            return
+        
+        self.close_player()
+        
+        try:
+            self.player = TrajectoryReader(path)
+        except (OSError, ValueError) as e:
+            print(f"Load recording error: {e}")
+            return
+        
+        # Rebuild the grid to match the recording
+        self.param_vars["num_intersections"].set(str(self.player.num_intersections))
+        self.canvas.delete("all")
+        self.create_intersection_grid()
+        for i, intersection in enumerate(self.intersections):
+            base_idx = i * 6
+            intersection.update_timings(self.player.timing[base_idx:base_idx + 6])
+        
+        self.seek_scale.config(to=max(0, self.player.num_ticks - 1))
+        if self.player.num_ticks:
+            self.show_frame(0)
+    
+    def show_frame(self, tick):
+        self.playback_tick = tick
+        states = self.player.frame(tick)
+        for intersection, state in zip(self.intersections, states):
+            intersection.update_lights(state['ns_state'], state['ew_state'])
+            intersection.update_queues(state['queue_ns'], state['queue_ew'])
+        
+        waiting = sum(state['queue_ns'] + state['queue_ew'] for state in states)
+        self.stats_labels['current_waiting'].config(text=f"Current Waiting Time: {waiting}")
+        self.playback_label.config(text=f"Tick: {tick}/{self.player.num_ticks - 1}")
+        self.seek_scale.set(tick)
+    
+    def seek_playback(self, value):
+        if not self.player or not self.player.num_ticks:
+            return
+        tick = int(float(value))
+        if tick != self.playback_tick:
+            self.show_frame(tick)
+    
+    def toggle_playback(self):
+        if not self.player or not self.player.num_ticks:
+            return
+        if self.playback_job:
+            self.stop_playback()
+        else:
+            if self.playback_tick >= self.player.num_ticks - 1:
+                self.show_frame(0)
+            self.playback_step()
+    
+    def close_player(self):
+        # Release the mapped recording before the file can be rewritten
+        self.stop_playback()
+        if self.player:
+            self.player.close()
+            self.player = None
+        self.seek_scale.config(to=0)
+        self.playback_label.config(text="Tick: -")
+    
+    def stop_playback(self):
+        if self.playback_job:
+            self.root.after_cancel(self.playback_job)
+            self.playback_job = None
+    
+    def playback_step(self):
+        try:
+            speed = max(0.1, float(self.playback_speed.get()))
+        except ValueError:
+            speed = 10.0
+        
+        # Skip ticks at high speeds rather than redrawing faster than ~30 fps
+        step = max(1, round(speed / 30))
+        delay = int(1000 * step / speed)
+        
+        tick = min(self.playback_tick + step, self.player.num_ticks - 1)
+        self.show_frame(tick)
+        if tick < self.player.num_ticks - 1:
+            self.playback_job = self.root.after(delay, self.playback_step)
+        else:
+            self.playback_job = None
+    
     def show_final_results(self, best_solution, best_fitness):
         results = tk.Toplevel(self.root)
         results.title("Optimization Results")
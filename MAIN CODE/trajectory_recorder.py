@@ -0,0 +1,194 @@
+import mmap
+import os
+import struct
+from array import array
+from typing import List, Dict
+
+# Light states are stored as one byte each instead of strings
+STATE_NAMES = ("GREEN", "YELLOW", "RED")
+STATE_CODES = {name: code for code, name in enumerate(STATE_NAMES)}
+
+# Column name and array typecode, laid out one after another in the file
+COLUMNS = (
+    ('ns_state', 'B'),
+    ('ew_state', 'B'),
+    ('queue_ns', 'I'),
+    ('queue_ew', 'I'),
+    ('arrivals_ns', 'H'),
+    ('arrivals_ew', 'H'),
+)
+
+MAGIC = b'TRJ1'
+HEADER = struct.Struct('<4sIII')  # magic, intersections, tick capacity, ticks recorded
+HEADER_SIZE = 64
+
+
+def _align(offset: int) -> int:
+    return (offset + 7) & ~7
+
+
+def _layout(num_intersections: int, num_ticks: int) -> tuple:
+    # Byte offsets of the timing plan and of every column, plus total file size
+    timing_offset = HEADER_SIZE
+    offset = _align(timing_offset + 2 * 6 * num_intersections)
+    offsets = {}
+    for name, typecode in COLUMNS:
+        offsets[name] = offset
+        offset = _align(offset + array(typecode).itemsize * num_ticks * num_intersections)
+    return timing_offset, offsets, offset
+
+
+class TrajectoryRecorder:
+    def __init__(self, path: str, num_intersections: int, num_ticks: int,
+                 timing: List[int] = None, chunk_ticks: int = 256):
+        self.path = path
+        self.num_intersections = num_intersections
+        self.num_ticks = num_ticks
+        self.chunk_ticks = max(1, min(chunk_ticks, num_ticks))
+        self.ticks_recorded = 0
+        self.chunk_start = 0
+        self.chunk_pos = 0
+
+        # Preallocated typed buffers for one chunk of ticks
+        chunk_len = self.chunk_ticks * num_intersections
+        self.chunk = {name: array(typecode, bytes(array(typecode).itemsize * chunk_len))
+                      for name, typecode in COLUMNS}
+
+        self.timing_offset, self.offsets, size = _layout(num_intersections, num_ticks)
+        # Write beside the target and swap it in on close, so readers of an
+        # older recording at the same path never see a half-written file
+        self.temp_path = path + '.tmp'
+        self.file = open(self.temp_path, 'w+b')
+        self.file.truncate(size)
+        self.mm = mmap.mmap(self.file.fileno(), size)
+        self.mm[:HEADER.size] = HEADER.pack(MAGIC, num_intersections, num_ticks, 0)
+        if timing is not None:
+            plan = array('H', timing[:6 * num_intersections])
+            self.mm[self.timing_offset:self.timing_offset + len(plan) * plan.itemsize] = plan.tobytes()
+
+    def record(self, lights: list):
+        # Append one tick for every intersection
+        self._append((STATE_CODES[light.state_ns], STATE_CODES[light.state_ew], light.queue_ns,
+                      light.queue_ew, light.arrivals_ns, light.arrivals_ew) for light in lights)
+
+    def record_engine(self, engine):
+        # Append one tick from a car_engine.CarEngine; its state codes match STATE_CODES
+        states = engine.light_states().tolist()
+        queues = engine.queue_lengths().tolist()
+        arrivals = engine.arrivals.reshape(-1, 2).tolist()
+        self._append((ns_state, ew_state, queue_ns, queue_ew, arrivals_ns, arrivals_ew)
+                     for (ns_state, ew_state), (queue_ns, queue_ew), (arrivals_ns, arrivals_ew)
+                     in zip(states, queues, arrivals))
+
+    def _append(self, rows):
+        # rows yields one (ns_state, ew_state, queue_ns, queue_ew, arrivals_ns, arrivals_ew) per intersection
+        if self.ticks_recorded >= self.num_ticks:
+            raise ValueError("Trajectory file is full")
+
+        chunk = self.chunk
+        base = self.chunk_pos * self.num_intersections
+        for i, row in enumerate(rows):
+            idx = base + i
+            for (name, _), value in zip(COLUMNS, row):
+                chunk[name][idx] = value
+
+        self.chunk_pos += 1
+        self.ticks_recorded += 1
+        if self.chunk_pos == self.chunk_ticks:
+            self.flush()
+
+    def flush(self):
+        # Copy the filled part of the chunk into the mapped columns
+        if self.chunk_pos == 0:
+            return
+        count = self.chunk_pos * self.num_intersections
+        for name, typecode in COLUMNS:
+            itemsize = self.chunk[name].itemsize
+            start = self.offsets[name] + self.chunk_start * self.num_intersections * itemsize
+            self.mm[start:start + count * itemsize] = memoryview(self.chunk[name])[:count].cast('B')
+        self.chunk_start += self.chunk_pos
+        self.chunk_pos = 0
+        self.mm[:HEADER.size] = HEADER.pack(MAGIC, self.num_intersections, self.num_ticks, self.ticks_recorded)
+
+    def close(self):
+        if self.mm.closed:
+            return
+        self.flush()
+        self.mm.flush()
+        self.mm.close()
+        self.file.close()
+        os.replace(self.temp_path, self.path)
+
+    def discard(self):
+        # Drop a partial recording and keep whatever was already at the path
+        if self.mm.closed:
+            return
+        self.mm.close()
+        self.file.close()
+        os.remove(self.temp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+
+
+class TrajectoryReader:
+    def __init__(self, path: str):
+        self.file = open(path, 'rb')
+        self.mm = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, self.num_intersections, capacity, self.num_ticks = HEADER.unpack_from(self.mm)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a trajectory file")
+
+        timing_offset, offsets, _ = _layout(self.num_intersections, capacity)
+        view = memoryview(self.mm)
+        timing = view[timing_offset:timing_offset + 2 * 6 * self.num_intersections].cast('H')
+        self.timing = timing.tolist()
+        timing.release()
+
+        # Zero-copy typed views over each column
+        self.columns = {}
+        for name, typecode in COLUMNS:
+            nbytes = array(typecode).itemsize * capacity * self.num_intersections
+            self.columns[name] = view[offsets[name]:offsets[name] + nbytes].cast(typecode)
+        self._view = view
+
+    def frame(self, tick: int) -> List[Dict]:
+        # Per-intersection state at a tick, in the same shape as TrafficLight.get_state()
+        if not 0 <= tick < self.num_ticks:
+            raise IndexError(f"Tick {tick} outside recorded range 0-{self.num_ticks - 1}")
+
+        columns = self.columns
+        states = []
+        for i in range(self.num_intersections):
+            idx = tick * self.num_intersections + i
+            states.append({
+                'ns_state': STATE_NAMES[columns['ns_state'][idx]],
+                'ew_state': STATE_NAMES[columns['ew_state'][idx]],
+                'queue_ns': columns['queue_ns'][idx],
+                'queue_ew': columns['queue_ew'][idx],
+                'arrivals_ns': columns['arrivals_ns'][idx],
+                'arrivals_ew': columns['arrivals_ew'][idx]
+            })
+        return states
+
+    def close(self):
+        for column in getattr(self, 'columns', {}).values():
+            column.release()
+        if hasattr(self, '_view'):
+            self._view.release()
+        self.mm.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()